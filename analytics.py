@@ -0,0 +1,210 @@
+"""Sales time series for the analytics reports.
+
+Revenue, units and sale counts per day, week or month, per model or brand,
+are bucketed in SQL from the daily rollup, then completed and smoothed
+with pandas. Sales in a period that has ended only change through a bulk
+import or a rollup rebuild, both of which bump the ``sales_history`` cache
+version, so those buckets are cached until the version moves. Only the
+current period is read from the database on every call.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import pandas as pd
+from sqlalchemy import Date, cast, func, select
+
+from models import Session, DailySalesRollup, Phone, SALES_HISTORY_CACHE
+from utils import cache_version
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# None totals every model into one series
+GROUPINGS = ('model', 'brand', None)
+
+# Pandas offsets matching the SQL buckets; weeks start on Monday
+_FREQUENCIES = {'day': 'D', 'week': 'W-MON', 'month': 'MS'}
+
+# Seconds between checks of the sales_history cache version
+ANALYTICS_PROBE_INTERVAL = float(os.getenv('ANALYTICS_CACHE_PROBE_SECONDS', '5'))
+
+# Closed-period results kept, least recently used dropped first
+CLOSED_CACHE_SIZE = 256
+
+TIMESERIES_COLUMNS = ['period', 'key', 'revenue', 'units', 'sales']
+
+_closed_lock = threading.Lock()
+_closed_cache = {
+    'version': None,
+    'checked_at': 0.0,
+    'frames': OrderedDict()
+}
+
+
+def period_start(day, granularity):
+    """First day of the day, Monday-based week or month containing ``day``."""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _bucket(dialect, granularity):
+    day = DailySalesRollup.day
+    if granularity == 'day':
+        return day
+    if dialect == 'postgresql':
+        return cast(func.date_trunc(granularity, day), Date)
+    if dialect == 'sqlite':
+        if granularity == 'week':
+            # Forward to Sunday, then back to that week's Monday
+            return func.date(day, 'weekday 0', '-6 days')
+        return func.date(day, 'start of month')
+    # Elsewhere bucket by day in SQL and let pandas fold the days into periods
+    return day
+
+
+def _group_key(by):
+    if by == 'model':
+        return DailySalesRollup.phone_model
+    if by == 'brand':
+        return func.coalesce(Phone.brand, 'Unknown')
+    # Totals: the 'All' key is added in pandas, PostgreSQL rejects a constant in GROUP BY
+    return None
+
+
+def _query_buckets(start, end, granularity, by):
+    session = Session()
+    try:
+        bucket = _bucket(session.get_bind().dialect.name, granularity).label('period')
+        key = _group_key(by)
+        keys = [] if key is None else [key.label('key')]
+        query = (
+            select(
+                bucket,
+                *keys,
+                func.sum(DailySalesRollup.revenue).label('revenue'),
+                func.sum(DailySalesRollup.units_sold).label('units'),
+                func.sum(DailySalesRollup.sale_count).label('sales')
+            )
+            .where(DailySalesRollup.day >= start, DailySalesRollup.day <= end)
+            .group_by(bucket, *keys)
+        )
+        if by == 'brand':
+            # Models removed from the inventory keep their sales under "Unknown"
+            query = query.outerjoin(Phone, Phone.model == DailySalesRollup.phone_model)
+        rows = session.execute(query).all()
+    finally:
+        session.close()
+
+    if key is None:
+        frame = pd.DataFrame(rows, columns=[column for column in TIMESERIES_COLUMNS if column != 'key'])
+        frame.insert(1, 'key', 'All')
+    else:
+        frame = pd.DataFrame(rows, columns=TIMESERIES_COLUMNS)
+    frame['period'] = pd.to_datetime(frame['period']).dt.to_period(_FREQUENCIES[granularity][0]).dt.start_time
+    frame = frame.astype({'revenue': 'float64', 'units': 'int64', 'sales': 'int64'})
+    # Folds day buckets into periods where SQL could not, and is a no-op otherwise
+    return frame.groupby(['period', 'key'], as_index=False)[['revenue', 'units', 'sales']].sum()
+
+
+def _closed_buckets(start, end, granularity, by):
+    now = time.monotonic()
+    with _closed_lock:
+        probe = now - _closed_cache['checked_at'] >= ANALYTICS_PROBE_INTERVAL
+    if probe:
+        version = cache_version(SALES_HISTORY_CACHE)
+        with _closed_lock:
+            if version != _closed_cache['version']:
+                _closed_cache['frames'].clear()
+                _closed_cache['version'] = version
+            _closed_cache['checked_at'] = now
+
+    cache_key = (start, end, granularity, by)
+    with _closed_lock:
+        frame = _closed_cache['frames'].get(cache_key)
+        if frame is not None:
+            _closed_cache['frames'].move_to_end(cache_key)
+            return frame
+
+    frame = _query_buckets(start, end, granularity, by)
+    with _closed_lock:
+        _closed_cache['frames'][cache_key] = frame
+        if len(_closed_cache['frames']) > CLOSED_CACHE_SIZE:
+            _closed_cache['frames'].popitem(last=False)
+    return frame
+
+
+def invalidate_analytics_cache():
+    with _closed_lock:
+        _closed_cache['frames'].clear()
+        _closed_cache['checked_at'] = 0.0
+
+
+def sales_timeseries(start, end, granularity='day', by='model'):
+    """Revenue, units and sales per period and key between ``start`` and ``end`` (dates, inclusive).
+
+    ``start`` is moved back to the start of its period so the first
+    bucket is whole. Every key sold in the range gets a row for every
+    period, zero when it sold nothing. Returns a long DataFrame with
+    period, key, revenue, units and sales columns.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    if by not in GROUPINGS:
+        raise ValueError(f"Unsupported grouping: {by}")
+    start = period_start(start, granularity)
+    current = period_start(date.today(), granularity)
+
+    parts = []
+    if start < current:
+        parts.append(_closed_buckets(start, min(end, current - timedelta(days=1)), granularity, by))
+    if end >= current:
+        parts.append(_query_buckets(max(start, current), end, granularity, by))
+    frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=TIMESERIES_COLUMNS)
+    if frame.empty:
+        return frame.astype({'period': 'datetime64[ns]', 'revenue': 'float64', 'units': 'int64', 'sales': 'int64'})
+
+    periods = pd.date_range(start, end, freq=_FREQUENCIES[granularity], name='period')
+    keys = pd.Index(sorted(frame['key'].unique()), name='key')
+    full = pd.MultiIndex.from_product([periods, keys])
+    return (
+        frame.set_index(['period', 'key'])
+        .reindex(full, fill_value=0)
+        .reset_index()
+        .astype({'revenue': 'float64', 'units': 'int64', 'sales': 'int64'})
+    )
+
+
+def pivot(frame, value='revenue', top=None):
+    """Periods by keys for ``value``; with ``top``, the rest of the keys are summed into "Other"."""
+    wide = frame.pivot(index='period', columns='key', values=value)
+    if top is not None and len(wide.columns) > top:
+        ranked = wide.sum().sort_values(ascending=False).index
+        wide = wide[ranked[:top]].assign(Other=wide[ranked[top:]].sum(axis=1))
+    return wide
+
+
+def moving_average(frame, value='revenue', window=7, top=None):
+    """Rolling mean of ``value`` over ``window`` periods for each key."""
+    return pivot(frame, value, top).rolling(window, min_periods=1).mean()
+
+
+def period_over_period(frame, value='revenue'):
+    """Each key's ``value`` in the last period of ``frame`` against the period before.
+
+    Returns key, current, previous, change and change_pct (NaN when the
+    previous period had nothing), largest current value first.
+    """
+    wide = pivot(frame, value)
+    if wide.empty:
+        return pd.DataFrame(columns=['key', 'current', 'previous', 'change', 'change_pct'])
+    current = wide.iloc[-1]
+    previous = wide.iloc[-2] if len(wide) > 1 else current * 0
+    result = pd.DataFrame({'current': current, 'previous': previous})
+    result['change'] = result['current'] - result['previous']
+    result['change_pct'] = (result['change'] / result['previous'].where(result['previous'] != 0)) * 100
+    return result.rename_axis('key').reset_index().sort_values('current', ascending=False, ignore_index=True)
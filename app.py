@@ -1,19 +1,40 @@
+import math
+import uuid
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from datetime import datetime, timedelta
 from utils import (
     load_inventory, 
-    save_inventory, 
+    add_phone,
+    update_phone,
+    remove_phone,
     validate_input, 
-    calculate_total_value,
-    get_low_stock_items,
+    get_dashboard_metrics,
+    get_low_stock_phones,
     record_sale,
-    get_sales_data,
-    get_sales_summary
+    record_cart_sale,
+    get_sales_page,
+    count_sales,
+    get_sales_summary,
+    search_products
 )
-from models import PaymentMethod, Session, User
-from auth import init_auth, require_auth, require_admin, show_login_page, logout_user, register_user # Added import for register_user
+from analytics import (
+    GRANULARITIES,
+    invalidate_analytics_cache,
+    moving_average,
+    period_over_period,
+    pivot,
+    sales_timeseries
+)
+from charts import TOP_N, inventory_value_figure, sales_figures, stock_figure
+from forecast import LEAD_DAYS, LOOKBACK_DAYS, REVIEW_DAYS, SERVICE_Z, reorder_suggestions
+from exports import EXPORT_FORMATS, export_inventory, export_sales
+from ledger import inventory_at, snapshot_if_due
+from database import pool_status
+from jobs import DONE, FAILED, QUEUED, runner
+from instrumentation import install, page_summary, recent_reruns, slowest_statements, clear_history, track_rerun
+from models import PaymentMethod, Session, User, engine
+from auth import init_auth, require_auth, require_admin, show_login_page, show_user_management, logout_user, register_user # Added import for register_user
 
 def show_password_change():
     st.header("Change Password")
@@ -43,81 +64,133 @@ st.set_page_config(
     layout="wide"
 )
 
+# Low-stock rows listed on the dashboard
+LOW_STOCK_ROWS = 50
+
+# Sales trend lines drawn before the rest are summed into "Other"
+TREND_SERIES = 8
+
+# Matches listed under a product search box
+SEARCH_RESULTS = 20
+
+# Seconds between progress checks on a running background job
+JOB_POLL_SECONDS = 1
+
+# Record every statement the app runs; idempotent across reruns
+install(engine)
+
 # Initialize session state
 if 'inventory_updated' not in st.session_state:
     st.session_state.inventory_updated = False
 
 def main():
-    init_auth()
-
-    if st.session_state.user:
-        st.title("📱 Austin Phones and Gadgets")
-
-        # User info and logout in sidebar
-        with st.sidebar:
-            st.write(f"Welcome, {st.session_state.user['username']}!")
-            if st.button("Logout"):
-                logout_user()
-                st.rerun()
-
-        # Sidebar navigation
-        pages = ["Dashboard", "Manage Inventory", "Record Sale", "Reports", "Change Password"]
-        page = st.sidebar.selectbox(
-            "Navigation",
-            pages
-        )
-
-        # Load inventory data
-        df = load_inventory()
-
-        if page == "Dashboard":
-            show_dashboard(df)
-        elif page == "Manage Inventory":
-            require_admin()  # Only admins can manage inventory
-            show_inventory_management(df)
-        elif page == "Record Sale":
-            show_sales_management(df)
-        elif page == "Change Password":
-            show_password_change()
+    # Count and time this rerun's SQL for the Performance page
+    with track_rerun() as rerun:
+        init_auth()
+
+        if st.session_state.user:
+            # Keeps stock history replays short between deploys
+            snapshot_if_due()
+
+            st.title("📱 Austin Phones and Gadgets")
+
+            # User info and logout in sidebar
+            with st.sidebar:
+                st.write(f"Welcome, {st.session_state.user['username']}!")
+                if st.button("Logout"):
+                    logout_user()
+                    st.rerun()
+
+            # Sidebar navigation
+            pages = ["Dashboard", "Manage Inventory", "Record Sale", "Import Sales", "Reports", "Manage Users", "Performance", "Change Password"]
+            page = st.sidebar.selectbox(
+                "Navigation",
+                pages
+            )
+            rerun.page = page
+
+            if page == "Dashboard":
+                show_dashboard()
+            elif page == "Manage Inventory":
+                require_admin()  # Only admins can manage inventory
+                show_inventory_management()
+            elif page == "Record Sale":
+                show_sales_management()
+            elif page == "Import Sales":
+                require_admin()  # Only admins can bulk import sales
+                show_sales_import()
+            elif page == "Manage Users":
+                require_admin()  # Only admins can manage users
+                st.header("Manage Users")
+                show_user_management()
+            elif page == "Performance":
+                require_admin()  # Only admins can see query statistics
+                show_performance()
+            elif page == "Change Password":
+                show_password_change()
+            else:
+                show_reports(load_inventory())
         else:
-            show_reports(df)
-    else:
-        show_login_page()
+            show_login_page()
 
-def show_dashboard(df):
+def show_dashboard():
     st.header("Dashboard")
 
-    # Get sales summary
-    sales_summary = get_sales_summary()
+    # Totals come from one aggregate query instead of the whole inventory
+    metrics = get_dashboard_metrics()
 
     # Key metrics
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Products", len(df))
+        st.metric("Total Products", metrics['total_products'])
     with col2:
-        st.metric("Total Items in Stock", int(df['quantity'].sum()))
+        st.metric("Total Items in Stock", int(metrics['total_stock']))
     with col3:
-        st.metric("Total Inventory Value", f"₦{calculate_total_value(df):,.2f}")
+        st.metric("Total Inventory Value", f"₦{metrics['inventory_value']:,.2f}")
     with col4:
-        st.metric("Total Sales", f"₦{sales_summary['total_sales']:,.2f}")
+        st.metric("Total Sales", f"₦{metrics['total_sales']:,.2f}")
 
     # Low stock alerts
     st.subheader("⚠️ Low Stock Alerts")
-    low_stock = get_low_stock_items(df)
-    if not low_stock.empty:
-        st.warning("The following items are running low on stock:")
-        st.dataframe(low_stock[['model', 'brand', 'quantity']])
+    if metrics['low_stock_count']:
+        st.warning(f"{metrics['low_stock_count']} items are at or below their reorder threshold:")
+        low_stock = get_low_stock_phones(limit=LOW_STOCK_ROWS)
+        st.dataframe(low_stock, hide_index=True)
+        if metrics['low_stock_count'] > LOW_STOCK_ROWS:
+            st.caption(f"Showing the {LOW_STOCK_ROWS} furthest below their threshold.")
     else:
         st.success("All items have sufficient stock!")
 
     # Stock distribution chart
     st.subheader("Stock Distribution")
-    if not df.empty:
-        fig = px.bar(df, x='model', y='quantity', color='brand',
-                     title="Current Stock Levels")
-        st.plotly_chart(fig, use_container_width=True)
-
-def show_inventory_management(df):
+    if metrics['total_products']:
+        views = {f"Top {TOP_N} models": 'top', "By brand": 'brand', "All models": 'all'}
+        view = st.radio("View", list(views), horizontal=True, key='stock_chart_view')
+        st.plotly_chart(stock_figure(views[view]), use_container_width=True)
+
+def product_picker(label, key):
+    """Search box plus a selectbox of the matching phones; returns the chosen phone dict or None.
+
+    Only the top SEARCH_RESULTS matches are sent to the browser, so the
+    catalogue size doesn't matter.
+    """
+    query = st.text_input(f"Search {label.lower()}", key=f'{key}_search',
+                          placeholder="Model or brand")
+    matches = {phone['model']: phone for phone in search_products(query, limit=SEARCH_RESULTS)}
+    if not matches:
+        st.info("No products match your search." if query.strip() else "No items in inventory.")
+        return None
+    model = st.selectbox(
+        label,
+        list(matches),
+        format_func=lambda m: f"{m} · {matches[m]['brand']} · {matches[m]['quantity']} in stock · ₦{matches[m]['price']:,.2f}",
+        key=key
+    )
+    if len(matches) == SEARCH_RESULTS:
+        st.caption(f"Showing the first {SEARCH_RESULTS} matches; type more to narrow the list.")
+    return matches[model]
+
+def show_inventory_management():
     st.header("Manage Inventory")
 
     tab1, tab2, tab3 = st.tabs(["Add New Item", "Update Stock", "Remove Item"])
@@ -129,34 +202,27 @@ def show_inventory_management(df):
             brand = st.text_input("Brand")
             price = st.number_input("Price (₦)", min_value=0.0, step=0.01)
             quantity = st.number_input("Quantity", min_value=0, value=0, step=1)
+            reorder_threshold = st.number_input("Reorder Threshold", min_value=0, value=5, step=1,
+                                                help="Stock at or below this shows as low")
 
             if st.form_submit_button("Add to Inventory"):
                 valid, message = validate_input(model, brand, price, quantity)
                 if valid:
-                    new_item = {
-                        'model': model,
-                        'brand': brand,
-                        'price': price,
-                        'quantity': quantity,
-                        'last_updated': datetime.now()
-                    }
-                    df = pd.concat([df, pd.DataFrame([new_item])], ignore_index=True)
-                    save_inventory(df)
-                    st.success("Item added successfully!")
-                    st.session_state.inventory_updated = True
+                    success, message = add_phone(model, brand, price, quantity, reorder_threshold)
+                    if success:
+                        st.success(message)
+                        st.session_state.inventory_updated = True
+                    else:
+                        st.error(message)
                 else:
                     st.error(message)
 
     with tab2:
         st.subheader("Update Existing Stock")
-        if not df.empty:
-            item_to_update = st.selectbox(
-                "Select Item to Update",
-                df['model'].tolist(),
-                key='update_select'
-            )
-            item_idx = df[df['model'] == item_to_update].index[0]
-            current_qty = int(df.loc[item_idx, 'quantity'])
+        phone = product_picker("Select Item to Update", 'update_select')
+        if phone:
+            item_to_update = phone['model']
+            current_qty = int(phone['quantity'])
 
             new_qty = st.number_input(
                 "New Quantity",
@@ -164,43 +230,43 @@ def show_inventory_management(df):
                 value=current_qty,
                 step=1
             )
+            new_threshold = st.number_input(
+                "Reorder Threshold",
+                min_value=0,
+                value=int(phone['reorder_threshold']),
+                step=1
+            )
 
             if st.button("Update Stock"):
-                df.loc[item_idx, 'quantity'] = new_qty
-                df.loc[item_idx, 'last_updated'] = datetime.now()
-                save_inventory(df)
-                st.success("Stock updated successfully!")
-                st.session_state.inventory_updated = True
-        else:
-            st.info("No items in inventory to update.")
+                success, message = update_phone(item_to_update, quantity=new_qty, reorder_threshold=new_threshold)
+                if success:
+                    st.success(message)
+                    st.session_state.inventory_updated = True
+                else:
+                    st.error(message)
 
     with tab3:
         st.subheader("Remove Item")
-        if not df.empty:
-            item_to_remove = st.selectbox(
-                "Select Item to Remove",
-                df['model'].tolist(),
-                key='remove_select'
-            )
+        phone = product_picker("Select Item to Remove", 'remove_select')
+        if phone:
+            item_to_remove = phone['model']
 
             if st.button("Remove Item"):
-                df = df[df['model'] != item_to_remove]
-                save_inventory(df)
-                st.success("Item removed successfully!")
-                st.session_state.inventory_updated = True
-        else:
-            st.info("No items in inventory to remove.")
+                success, message = remove_phone(item_to_remove)
+                if success:
+                    st.success(message)
+                    st.session_state.inventory_updated = True
+                else:
+                    st.error(message)
 
-def show_sales_management(df):
+def show_sales_management():
     st.header("Record Sale")
 
-    if df.empty:
-        st.warning("No items in inventory. Please add items first.")
-        return
-
     # Product selection outside form for dynamic updates
-    phone_model = st.selectbox("Select Product", df['model'].tolist(), key='product_select')
-    selected_phone = df[df['model'] == phone_model].iloc[0]
+    selected_phone = product_picker("Select Product", 'product_select')
+    if selected_phone is None:
+        return
+    phone_model = selected_phone['model']
 
     # Display product info
     col1, col2 = st.columns(2)
@@ -209,26 +275,101 @@ def show_sales_management(df):
     with col2:
         st.info(f"Unit price: ₦{selected_phone['price']:.2f}")
 
-    with st.form("record_sale_form", clear_on_submit=True):
-        # Sale details
-        quantity = st.number_input("Quantity", min_value=1, max_value=int(selected_phone['quantity']), value=1, key='quantity_input')
-        unit_price = st.number_input("Unit Price (₦)", min_value=0.0, value=float(selected_phone['price']), step=0.01, key='price_input')
-        payment_method = st.selectbox("Payment Method", [method.value for method in PaymentMethod])
-
-        # Customer details
-        customer_name = st.text_input("Customer Name (Optional)")
-        customer_phone = st.text_input("Customer Phone (Optional)")
-        notes = st.text_area("Notes (Optional)")
-
-        # Calculate total
-        total_amount = quantity * unit_price
-        st.write(f"Total Amount: ${total_amount:.2f}")
-
-        if st.form_submit_button("Record Sale"):
-            success, message = record_sale(
-                phone_model=phone_model,
-                quantity_sold=quantity,
-                unit_price=unit_price,
+    tab1, tab2 = st.tabs(["Single Sale", "Cart"])
+
+    with tab1:
+        with st.form("record_sale_form", clear_on_submit=True):
+            # Sale details
+            quantity = st.number_input("Quantity", min_value=1, max_value=int(selected_phone['quantity']), value=1, key='quantity_input')
+            unit_price = st.number_input("Unit Price (₦)", min_value=0.0, value=float(selected_phone['price']), step=0.01, key='price_input')
+            payment_method = st.selectbox("Payment Method", [method.value for method in PaymentMethod])
+
+            # Customer details
+            customer_name = st.text_input("Customer Name (Optional)")
+            customer_phone = st.text_input("Customer Phone (Optional)")
+            notes = st.text_area("Notes (Optional)")
+
+            # Calculate total
+            total_amount = quantity * unit_price
+            st.write(f"Total Amount: ${total_amount:.2f}")
+
+            if st.form_submit_button("Record Sale"):
+                success, message = record_sale(
+                    phone_model=phone_model,
+                    quantity_sold=quantity,
+                    unit_price=unit_price,
+                    payment_method=PaymentMethod(payment_method),
+                    customer_name=customer_name,
+                    customer_phone=customer_phone,
+                    notes=notes
+                )
+
+                if success:
+                    st.success(message)
+                    st.session_state.inventory_updated = True
+                else:
+                    st.error(message)
+
+    with tab2:
+        show_cart(phone_model, selected_phone)
+
+def show_cart(phone_model, selected_phone):
+    if 'cart' not in st.session_state:
+        st.session_state.cart = []
+    cart = st.session_state.cart
+
+    in_cart = sum(line['quantity'] for line in cart if line['model'] == phone_model)
+    available = int(selected_phone['quantity']) - in_cart
+
+    with st.form("add_to_cart_form", clear_on_submit=True):
+        col1, col2 = st.columns(2)
+        with col1:
+            quantity = st.number_input("Quantity", min_value=1, max_value=max(available, 1), value=1, key='cart_quantity_input')
+        with col2:
+            unit_price = st.number_input("Unit Price (₦)", min_value=0.0, value=float(selected_phone['price']), step=0.01, key='cart_price_input')
+
+        if st.form_submit_button("Add to Cart", disabled=available < 1):
+            cart.append({'model': phone_model, 'quantity': quantity, 'unit_price': unit_price})
+            st.rerun()
+
+    if not cart:
+        st.info("Cart is empty.")
+        return
+
+    cart_df = pd.DataFrame(cart)
+    cart_df['total'] = cart_df['quantity'] * cart_df['unit_price']
+    st.dataframe(
+        cart_df.rename(columns={'model': 'Model', 'quantity': 'Quantity', 'unit_price': 'Unit Price', 'total': 'Total'}),
+        use_container_width=True
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        line_to_remove = st.selectbox(
+            "Line",
+            range(len(cart)),
+            format_func=lambda i: f"{cart[i]['model']} × {cart[i]['quantity']}",
+            key='cart_remove_select'
+        )
+        if st.button("Remove Line"):
+            cart.pop(line_to_remove)
+            st.rerun()
+    with col2:
+        if st.button("Clear Cart"):
+            cart.clear()
+            st.rerun()
+
+    with st.form("checkout_form"):
+        payment_method = st.selectbox("Payment Method", [method.value for method in PaymentMethod], key='cart_payment_method')
+        customer_name = st.text_input("Customer Name (Optional)", key='cart_customer_name')
+        customer_phone = st.text_input("Customer Phone (Optional)", key='cart_customer_phone')
+        notes = st.text_area("Notes (Optional)", key='cart_notes')
+
+        st.write(f"Total Amount: ₦{cart_df['total'].sum():,.2f}")
+
+        if st.form_submit_button("Checkout"):
+            success, message = record_cart_sale(
+                lines=[(line['model'], line['quantity'], line['unit_price']) for line in cart],
                 payment_method=PaymentMethod(payment_method),
                 customer_name=customer_name,
                 customer_phone=customer_phone,
@@ -236,16 +377,256 @@ def show_sales_management(df):
             )
 
             if success:
+                cart.clear()
                 st.success(message)
                 st.session_state.inventory_updated = True
             else:
                 st.error(message)
 
+def show_sales_import():
+    from sales_import import import_sales
+
+    st.header("Import Sales")
+    st.write(
+        "Upload a CSV with a header row, or a JSONL file with one object per line. "
+        "Required fields: `phone_model`, `quantity_sold`, `unit_price`, `payment_method`. "
+        "Optional: `sale_date` (ISO format), `customer_name`, `customer_phone`, `notes`."
+    )
+
+    uploaded = st.file_uploader("Sales file", type=['csv', 'jsonl', 'ndjson', 'json'])
+    if uploaded is not None and st.button("Import"):
+        with st.spinner("Importing sales..."):
+            report = import_sales(uploaded)
+        if report['imported']:
+            st.success(f"Imported {report['imported']} of {report['rows']} rows.")
+            st.session_state.inventory_updated = True
+            invalidate_analytics_cache()
+        if report['errors']:
+            st.error(f"{len(report['errors'])} rows were rejected.")
+            st.dataframe(
+                pd.DataFrame(report['errors'], columns=['Line', 'Error']),
+                use_container_width=True
+            )
+
+def _job_owner():
+    # Jobs whose result belongs to one session, like an export file, carry this in their key
+    if 'job_owner' not in st.session_state:
+        st.session_state.job_owner = uuid.uuid4().hex
+    return st.session_state.job_owner
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(key):
+    """Progress of a background job, refreshed on its own until the job ends and the page reruns."""
+    status = runner.status(key)
+    if status is None or status['status'] in (DONE, FAILED):
+        st.rerun()
+    if status['status'] == QUEUED:
+        text = f"{status['label']} is waiting for a worker ({status['waited']:.0f}s)"
+    else:
+        text = f"{status['label']} is running ({status['elapsed']:.0f}s)"
+        if status['message']:
+            text += f" · {status['message']}"
+    st.progress(status['progress'] or 0.0, text=text)
+
+def job_result(key, fn, *args, label, **kwargs):
+    """Result of ``fn(*args, **kwargs)`` run as a background job, or None while it runs.
+
+    Identical ``key``s share one run and its cached result. While the job
+    runs its progress is shown in place and the page reruns when it ends.
+    """
+    status = runner.status(key)
+    if status and status['status'] == FAILED:
+        st.error(f"{label} failed: {status['error']}")
+        if st.button("Retry", key=f'retry_{hash(key)}'):
+            runner.forget(key)
+            st.rerun()
+        return None
+    runner.submit(key, fn, *args, label=label, **kwargs)
+    if runner.status(key)['status'] == DONE:
+        return runner.result(key)
+    show_job_progress(key)
+    return None
+
+def show_export(key, label, export, params=()):
+    """Export button that writes the file in the background and offers it for download.
+
+    ``params`` identifies what is exported, so a repeated click joins the
+    running export instead of starting another. The prepared file lives in
+    this user's session only, so concurrent users never overwrite each
+    other's exports.
+    """
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        fmt = st.selectbox("Format", list(EXPORT_FORMATS), format_func=str.upper, key=f'{key}_export_format')
+    with col2:
+        if st.button(f"Export {label}", key=f'{key}_export_button'):
+            job_key = ('export', key, fmt, params, _job_owner())
+            runner.submit(job_key, export, fmt, label=f"{label} export")
+            st.session_state[f'{key}_export_job'] = job_key
+
+    job_key = st.session_state.get(f'{key}_export_job')
+    if job_key:
+        status = runner.status(job_key)
+        if status is None or status['status'] in (DONE, FAILED):
+            del st.session_state[f'{key}_export_job']
+            if status and status['status'] == FAILED:
+                st.error(f"{label} export failed: {status['error']}")
+            elif status:
+                previous = st.session_state.get(f'{key}_export_file')
+                if previous:
+                    previous[1].close()
+                # The file is this session's from now on, not a shared cached result
+                st.session_state[f'{key}_export_file'] = (job_key[2], runner.result(job_key))
+            runner.forget(job_key)
+        else:
+            show_job_progress(job_key)
+
+    with col3:
+        prepared = st.session_state.get(f'{key}_export_file')
+        if prepared and prepared[0] == fmt:
+            export_file = prepared[1]
+            export_file.seek(0)
+            st.download_button(
+                f"Download {label} {fmt.upper()}",
+                data=export_file,
+                file_name=f"{key}_export_{datetime.now():%Y%m%d}.{fmt}",
+                mime=EXPORT_FORMATS[fmt],
+                key=f'{key}_download_button'
+            )
+
+def show_performance():
+    st.header("Performance")
+    st.caption("SQL statements and database time per rerun, over the most recent reruns of every session.")
+
+    records = recent_reruns()
+    if st.button("Clear History"):
+        clear_history()
+        st.rerun()
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Reruns Recorded", len(records))
+    with col2:
+        st.metric("Statements per Rerun", f"{sum(r['statements'] for r in records) / len(records):.1f}" if records else "-")
+    with col3:
+        st.metric("DB Time per Rerun", f"{sum(r['db_ms'] for r in records) / len(records):.1f} ms" if records else "-")
+    with col4:
+        pool = pool_status(engine)
+        st.metric("Connections in Use", pool.get('checked_out', '-'), help=f"Pool: {pool['pool']}")
+
+    st.subheader("By Page")
+    st.dataframe(page_summary(records), use_container_width=True, hide_index=True)
+
+    st.subheader("Slowest Statements")
+    st.dataframe(slowest_statements(records=records), use_container_width=True, hide_index=True)
+
+    st.subheader("Recent Reruns")
+    recent = pd.DataFrame(records[-50:][::-1], columns=['started_at', 'page', 'statements', 'db_ms', 'total_ms', 'rows'])
+    st.dataframe(recent, use_container_width=True, hide_index=True)
+
+    st.subheader("Background Jobs")
+    background = runner.jobs()
+    if background:
+        st.dataframe(
+            pd.DataFrame(background, columns=['label', 'status', 'waited', 'elapsed', 'message', 'error']).round(2),
+            use_container_width=True,
+            hide_index=True
+        )
+    else:
+        st.caption("No background jobs running or cached.")
+
+    with st.expander("Connection Pool"):
+        st.json(pool)
+
+def show_sales_trends():
+    st.subheader("Sales Trends")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        granularity = st.selectbox("Period", GRANULARITIES, index=1, format_func=str.title, key='trend_granularity')
+    with col2:
+        by = st.selectbox("Group By", ['model', 'brand', None],
+                          format_func=lambda option: option.title() if option else "Total", key='trend_group')
+    with col3:
+        metric = st.selectbox("Measure", ['revenue', 'units'], format_func=str.title, key='trend_metric')
+    with col4:
+        window = st.number_input("Moving Average (periods)", min_value=1, max_value=52, value=4, key='trend_window')
+    today = datetime.now().date()
+    date_range = st.date_input("Date Range", value=(today - timedelta(days=180), today), key='trend_range')
+    if len(date_range) != 2:
+        st.info("Pick the end of the range.")
+        return
+    start, end = date_range
+
+    series = job_result(('sales_timeseries', start, end, granularity, by), sales_timeseries,
+                        start, end, granularity, by, label="Sales trends")
+    if series is None:
+        return
+    if series.empty:
+        st.info("No sales in this range.")
+        return
+
+    import plotly.graph_objects as go
+
+    # Keep the chart readable: the biggest sellers get their own line, the rest are summed
+    values = pivot(series, metric, top=TREND_SERIES)
+    averages = moving_average(series, metric, window, top=TREND_SERIES)
+    fig = go.Figure()
+    for key in values.columns:
+        fig.add_trace(go.Scatter(x=values.index, y=values[key], name=str(key), mode='lines+markers', opacity=0.35))
+        fig.add_trace(go.Scatter(x=averages.index, y=averages[key], name=f"{key} ({window}-period avg)", mode='lines'))
+    fig.update_layout(title=f"{metric.title()} per {granularity}", xaxis_title="Period", yaxis_title=metric.title())
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.caption(f"Latest {granularity} against the one before; the current {granularity} is still in progress.")
+    st.dataframe(period_over_period(series, metric), use_container_width=True, hide_index=True)
+
+def show_reorder_suggestions():
+    st.subheader("Reorder Suggestions")
+    st.caption(
+        "Phones whose stock is at or below the demand expected over the supplier lead time plus "
+        "safety stock. Suggested orders cover the lead time and the review period."
+    )
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        lookback_days = st.number_input("History (days)", min_value=7, max_value=730, value=LOOKBACK_DAYS, key='reorder_lookback')
+    with col2:
+        lead_days = st.number_input("Lead Time (days)", min_value=0.0, value=LEAD_DAYS, step=1.0, key='reorder_lead')
+    with col3:
+        review_days = st.number_input("Review Period (days)", min_value=0.0, value=REVIEW_DAYS, step=1.0, key='reorder_review')
+    with col4:
+        service_z = st.number_input("Safety Factor (σ)", min_value=0.0, value=SERVICE_Z, step=0.05, key='reorder_z',
+                                    help="1.65 covers about 95% of lead times without a stockout")
+
+    options = {
+        'lookback_days': int(lookback_days),
+        'lead_days': lead_days,
+        'review_days': review_days,
+        'service_z': service_z
+    }
+    suggestions = job_result(('reorder_suggestions', datetime.now().date(), tuple(sorted(options.items()))),
+                             reorder_suggestions, label="Reorder suggestions", **options)
+    if suggestions is None:
+        return
+    if suggestions.empty:
+        st.success("Nothing needs reordering.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Phones to Reorder", len(suggestions))
+    with col2:
+        st.metric("Order Value", f"₦{suggestions['order_value'].sum():,.2f}")
+    st.dataframe(
+        suggestions.round({'daily_demand': 2, 'demand_std': 2, 'days_of_cover': 1, 'order_value': 2}),
+        use_container_width=True,
+        hide_index=True
+    )
+
 def show_reports(df):
     st.header("Reports")
 
     # Tabs for different reports
-    tab1, tab2, tab3 = st.tabs(["Inventory", "Sales History", "Sales Analytics"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Inventory", "Sales History", "Sales Analytics", "Reorder Suggestions"])
 
     with tab1:
         st.subheader("Current Inventory")
@@ -254,18 +635,29 @@ def show_reports(df):
 
             # Value by brand chart
             st.subheader("Inventory Value by Brand")
-            brand_value = df.groupby('brand').apply(
-                lambda x: (x['price'] * x['quantity']).sum()
-            ).reset_index()
-            brand_value.columns = ['Brand', 'Total Value']
-            fig = px.pie(brand_value, values='Total Value', names='Brand',
-                         title="Inventory Value Distribution by Brand")
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(inventory_value_figure(), use_container_width=True)
 
             # Export option
-            if st.button("Export Inventory to CSV"):
-                df.to_csv('inventory_export.csv', index=False)
-                st.success("Inventory exported successfully!")
+            show_export('inventory', "Inventory", export_inventory)
+
+            # Stock on a past date, from the nearest snapshot plus the ledger
+            st.subheader("Inventory on a Past Date")
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                history_date = st.date_input("Date", datetime.now().date(), key='inventory_history_date')
+            if st.button("Show Inventory on Date"):
+                # Kept in the session so the result still shows on the reruns that poll the job
+                st.session_state.inventory_history_at = datetime.combine(history_date, datetime.max.time())
+            history_at = st.session_state.get('inventory_history_at')
+            if history_at:
+                past_df = job_result(('inventory_at', history_at), inventory_at, history_at,
+                                     label="Inventory on a past date")
+                if past_df is not None:
+                    st.metric(
+                        f"Inventory value at end of {history_at.date()}",
+                        f"₦{(past_df['price'].fillna(0) * past_df['quantity']).sum():,.2f}"
+                    )
+                    st.dataframe(past_df, use_container_width=True)
         else:
             st.info("No items in inventory to display.")
 
@@ -278,16 +670,46 @@ def show_reports(df):
         with col2:
             end_date = st.date_input("End Date", datetime.now())
 
-        sales_df = get_sales_data(
-            start_date=datetime.combine(start_date, datetime.min.time()),
-            end_date=datetime.combine(end_date, datetime.max.time())
-        )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            model_filter = st.text_input("Model", placeholder="All models")
+        with col2:
+            payment_filter = st.selectbox("Payment Method", ["All"] + [method.value for method in PaymentMethod])
+        with col3:
+            page_size = st.selectbox("Rows per page", [25, 50, 100, 200], index=1)
+
+        query = {
+            'start_date': datetime.combine(start_date, datetime.min.time()),
+            'end_date': datetime.combine(end_date, datetime.max.time()),
+            'phone_model': model_filter.strip() or None,
+            'payment_method': None if payment_filter == "All" else payment_filter
+        }
+
+        # Cursor of every page visited so far, restarted whenever the filters change
+        if st.session_state.get('sales_history_query') != (query, page_size):
+            st.session_state.sales_history_query = (query, page_size)
+            st.session_state.sales_history_cursors = [None]
+        cursors = st.session_state.sales_history_cursors
+
+        sales_df, next_cursor = get_sales_page(after=cursors[-1], page_size=page_size, **query)
 
         if not sales_df.empty:
             st.dataframe(sales_df, use_container_width=True)
-            if st.button("Export Sales to CSV"):
-                sales_df.to_csv('sales_export.csv', index=False)
-                st.success("Sales data exported successfully!")
+
+            total = count_sales(**query)
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("◀ Previous", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+            with col2:
+                st.caption(f"Page {len(cursors)} of {max(1, math.ceil(total / page_size))} · {total:,} sales")
+            with col3:
+                if st.button("Next ▶", disabled=next_cursor is None):
+                    cursors.append(next_cursor)
+                    st.rerun()
+
+            show_export('sales', "Sales", lambda fmt: export_sales(fmt, **query), tuple(query.items()))
         else:
             st.info("No sales data available for the selected period.")
 
@@ -302,6 +724,8 @@ def show_reports(df):
         with col2:
             st.metric("Total Units Sold", sales_summary['total_units'])
 
+        show_sales_trends()
+
         # Sales by model
         if sales_summary['sales_by_model']:
             sales_by_model_df = pd.DataFrame(
@@ -311,18 +735,16 @@ def show_reports(df):
             st.subheader("Sales by Model")
             st.dataframe(sales_by_model_df, use_container_width=True)
 
-            # Revenue by model chart
-            fig = px.bar(sales_by_model_df, x='Model', y='Revenue',
-                        title="Revenue by Model")
-            st.plotly_chart(fig, use_container_width=True)
-
-            # Units sold by model chart
-            fig = px.pie(sales_by_model_df, values='Units Sold', names='Model',
-                        title="Units Sold Distribution by Model")
-            st.plotly_chart(fig, use_container_width=True)
+            # Revenue and units charts, top models plus "Other"
+            revenue_fig, units_fig = sales_figures()
+            st.plotly_chart(revenue_fig, use_container_width=True)
+            st.plotly_chart(units_fig, use_container_width=True)
         else:
             st.info("No sales data available for analysis.")
 
+    with tab4:
+        show_reorder_suggestions()
+
 if __name__ == "__main__":
     main()
 
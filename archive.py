@@ -0,0 +1,320 @@
+"""Tiered storage for old sales.
+
+Sales older than the archive horizon are moved out of the sales table into
+zstd-compressed Parquet files, one directory per month of sale date:
+
+    <SALES_ARCHIVE_DIR>/month=2024-03/part-<uuid>.parquet
+
+``manifest.json`` in the same directory lists every file with its row count
+and first and last sale date, plus the watermark: every sale before it has
+been archived. Readers only open files the manifest lists, and only those
+whose dates overlap the query, so last week's report never touches the
+archive. Within a file the date, model and payment filters are pushed down
+to the Parquet row groups.
+
+The daily rollup keeps archived sales, so totals and analytics read from it
+are unaffected. The raw-sales readers in utils and exports merge these
+files with the rows still in the database.
+
+An archive run writes a month's file and its manifest entry, then deletes
+those rows from the sales table in the same transaction it commits last.
+If it stops in between, the rows are in both places until the next run,
+which drops the copies it finds already archived instead of writing them
+twice.
+
+Environment variables:
+    SALES_ARCHIVE_DIR         where the Parquet files live (default data/archive/sales)
+    SALES_ARCHIVE_AFTER_DAYS  age in days at which sales are archived (default 365)
+"""
+import json
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, func, select
+
+from models import Session, Sale, PaymentMethod, PAYMENT_COUNT_COLUMNS
+
+ARCHIVE_DIR = os.getenv('SALES_ARCHIVE_DIR', os.path.join('data', 'archive', 'sales'))
+ARCHIVE_AFTER_DAYS = int(os.getenv('SALES_ARCHIVE_AFTER_DAYS', '365'))
+
+# Columns written for every archived sale, in file order
+ARCHIVE_COLUMNS = [
+    'id', 'sale_date', 'phone_model', 'quantity_sold', 'unit_price', 'total_amount',
+    'payment_method', 'customer_name', 'customer_phone', 'notes'
+]
+
+# Rows per Parquet row group; smaller groups prune better on date, larger compress better
+ROW_GROUP_SIZE = 100000
+
+# Sale ids per DELETE statement
+DELETE_CHUNK_SIZE = 1000
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    types = {
+        'id': pa.int64(),
+        'sale_date': pa.timestamp('us'),
+        'quantity_sold': pa.int64(),
+        'unit_price': pa.float64(),
+        'total_amount': pa.float64()
+    }
+    return pa.schema([(column, types.get(column, pa.string())) for column in ARCHIVE_COLUMNS])
+
+
+def _manifest_path(directory):
+    return os.path.join(directory, 'manifest.json')
+
+
+def load_manifest(directory=None):
+    """The archive's manifest: ``{'watermark': ISO datetime or None, 'files': [...]}``."""
+    path = _manifest_path(directory or ARCHIVE_DIR)
+    if not os.path.exists(path):
+        return {'watermark': None, 'files': []}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _save_manifest(directory, manifest):
+    # Readers see the old or the new manifest, never a partial one
+    path = _manifest_path(directory)
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def archive_watermark(directory=None):
+    """Every sale before this datetime is archived; None when nothing is."""
+    watermark = load_manifest(directory)['watermark']
+    return datetime.fromisoformat(watermark) if watermark else None
+
+
+def date_bounds(start_date=None, end_date=None):
+    """The bounds as datetimes: a plain date starts at its first instant or ends at its last."""
+    if start_date is not None and not isinstance(start_date, datetime):
+        start_date = datetime.combine(start_date, time.min)
+    if end_date is not None and not isinstance(end_date, datetime):
+        end_date = datetime.combine(end_date, time.max)
+    return start_date, end_date
+
+
+def _entries(directory, start_date=None, end_date=None, newest_first=False):
+    # Partition pruning: only files whose dates overlap [start_date, end_date]
+    entries = [
+        entry for entry in load_manifest(directory)['files']
+        if (start_date is None or datetime.fromisoformat(entry['max_date']) >= start_date)
+        and (end_date is None or datetime.fromisoformat(entry['min_date']) <= end_date)
+    ]
+    return sorted(entries, key=lambda entry: (entry['month'], entry['path']), reverse=newest_first)
+
+
+def _files(directory, start_date=None, end_date=None):
+    return [os.path.join(directory, entry['path']) for entry in _entries(directory, start_date, end_date)]
+
+
+def _arrow_filters(start_date=None, end_date=None, phone_model=None, payment_method=None):
+    filters = []
+    if start_date:
+        filters.append(('sale_date', '>=', pd.Timestamp(start_date)))
+    if end_date:
+        filters.append(('sale_date', '<=', pd.Timestamp(end_date)))
+    if phone_model:
+        filters.append(('phone_model', '==', phone_model))
+    if payment_method:
+        filters.append(('payment_method', '==', PaymentMethod(payment_method).value))
+    return filters or None
+
+
+def _as_sales_frame(table, columns):
+    # Built like utils._frame_from_batches builds frames from the sales table, so the two concatenate cleanly
+    data = {}
+    for column in columns:
+        values = table.column(column)
+        if column == 'sale_date':
+            data[column] = values.to_numpy().astype('datetime64[us]')
+        elif column == 'payment_method':
+            data[column] = pd.Categorical(values.to_pylist(), categories=[method.value for method in PaymentMethod])
+        elif values.type == 'string':
+            data[column] = np.array(values.to_pylist(), dtype=object)
+        else:
+            data[column] = values.to_numpy()
+    return pd.DataFrame(data, columns=columns)
+
+
+def iter_sales(columns, start_date=None, end_date=None, phone_model=None, payment_method=None, directory=None):
+    """Yield the matching archived sales as one DataFrame per file, oldest file first."""
+    import pyarrow.parquet as pq
+
+    directory = directory or ARCHIVE_DIR
+    start_date, end_date = date_bounds(start_date, end_date)
+    filters = _arrow_filters(start_date, end_date, phone_model, payment_method)
+    for path in _files(directory, start_date, end_date):
+        table = pq.read_table(path, columns=columns, filters=filters)
+        if table.num_rows:
+            yield _as_sales_frame(table, columns)
+
+
+def read_sales(columns, start_date=None, end_date=None, phone_model=None, payment_method=None, directory=None):
+    """The matching archived sales as one DataFrame with ``columns``, or None when there are none."""
+    frames = list(iter_sales(columns, start_date, end_date, phone_model, payment_method, directory))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def read_sales_page(columns, after=None, limit=50, start_date=None, end_date=None, phone_model=None,
+                    payment_method=None, directory=None):
+    """Up to ``limit`` archived sales before the ``(sale_date, id)`` cursor ``after``, newest first.
+
+    Returns a DataFrame with ``columns`` plus sale_date and id, or None when
+    there are none. Months are read newest first and reading stops once
+    ``limit`` rows are in hand, so early pages only open recent months.
+    """
+    import pyarrow.parquet as pq
+
+    directory = directory or ARCHIVE_DIR
+    start_date, end_date = date_bounds(start_date, end_date)
+    if after is not None:
+        end_date = min(end_date, after[0]) if end_date else after[0]
+    filters = _arrow_filters(start_date, end_date, phone_model, payment_method)
+    read_columns = list(dict.fromkeys(columns + ['sale_date', 'id']))
+    frames, found = [], 0
+    for entry in _entries(directory, start_date, end_date, newest_first=True):
+        # Months don't overlap, so once a month fills the page every older file can be skipped
+        if found >= limit and entry['month'] != month:
+            break
+        month = entry['month']
+        table = pq.read_table(os.path.join(directory, entry['path']), columns=read_columns, filters=filters)
+        df = _as_sales_frame(table, read_columns)
+        if after is not None:
+            df = df[(df['sale_date'] < after[0]) | ((df['sale_date'] == after[0]) & (df['id'] < after[1]))]
+        if len(df):
+            frames.append(df)
+            found += len(df)
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values(['sale_date', 'id'], ascending=False, ignore_index=True).head(limit)
+
+
+def count_sales(start_date=None, end_date=None, phone_model=None, payment_method=None, directory=None):
+    """Number of archived sales matching the filters."""
+    import pyarrow.parquet as pq
+
+    directory = directory or ARCHIVE_DIR
+    start_date, end_date = date_bounds(start_date, end_date)
+    filters = _arrow_filters(start_date, end_date, phone_model, payment_method)
+    return sum(
+        pq.read_table(path, columns=['id'], filters=filters).num_rows
+        for path in _files(directory, start_date, end_date)
+    )
+
+
+def rollup_rows(directory=None):
+    """Archived sales folded into sales_daily_rollup rows, one per day and model."""
+    rows = []
+    for df in iter_sales(['sale_date', 'phone_model', 'quantity_sold', 'total_amount', 'payment_method'],
+                         directory=directory):
+        df['day'] = df['sale_date'].dt.date
+        for method, column in PAYMENT_COUNT_COLUMNS.items():
+            df[column] = (df['payment_method'] == method.value).astype('int64')
+        grouped = df.groupby(['day', 'phone_model'], observed=True).agg(
+            units_sold=('quantity_sold', 'sum'),
+            revenue=('total_amount', 'sum'),
+            sale_count=('quantity_sold', 'size'),
+            **{column: (column, 'sum') for column in PAYMENT_COUNT_COLUMNS.values()}
+        )
+        rows.extend(
+            {key: value.item() if hasattr(value, 'item') else value for key, value in row.items()}
+            for row in grouped.reset_index().to_dict('records')
+        )
+    return rows
+
+
+def _archived_ids(directory, month_start, month_end):
+    import pyarrow.parquet as pq
+
+    ids = set()
+    for path in _files(directory, month_start, month_end):
+        ids.update(pq.read_table(path, columns=['id']).column('id').to_pylist())
+    return ids
+
+
+def _month_after(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def archive_sales(before=None, directory=None):
+    """Move sales dated before ``before`` from the sales table into the archive.
+
+    ``before`` defaults to the start of the day ARCHIVE_AFTER_DAYS ago.
+    Works a month at a time, committing each month. Returns a dict with the
+    number of sales archived, the files written and the new watermark.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = directory or ARCHIVE_DIR
+    before = before or datetime.combine(date.today() - timedelta(days=ARCHIVE_AFTER_DAYS), time.min)
+    manifest = load_manifest(directory)
+    old_watermark = datetime.fromisoformat(manifest['watermark']) if manifest['watermark'] else None
+    schema = _arrow_schema()
+    report = {'archived': 0, 'files': [], 'watermark': old_watermark}
+
+    session = Session()
+    try:
+        while True:
+            first = session.execute(select(func.min(Sale.sale_date)).where(Sale.sale_date < before)).scalar()
+            if first is None:
+                break
+            month_start = datetime.combine(first.date().replace(day=1), time.min)
+            month_end = min(datetime.combine(_month_after(first.date()), time.min), before)
+
+            rows = session.execute(
+                select(*(getattr(Sale, column) for column in ARCHIVE_COLUMNS))
+                .where(Sale.sale_date >= month_start, Sale.sale_date < month_end)
+                .order_by(Sale.sale_date, Sale.id)
+            ).all()
+            df = pd.DataFrame(rows, columns=ARCHIVE_COLUMNS)
+            df['payment_method'] = [method.value for method in df['payment_method']]
+            ids = df['id'].tolist()
+
+            if old_watermark and month_start < old_watermark:
+                # Left behind by an interrupted run, or imported late: skip what is already archived
+                df = df[~df['id'].isin(_archived_ids(directory, month_start, month_end))]
+
+            if len(df):
+                relative = os.path.join(f"month={month_start:%Y-%m}", f"part-{uuid.uuid4().hex}.parquet")
+                path = os.path.join(directory, relative)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                pq.write_table(
+                    pa.Table.from_pandas(df, schema=schema, preserve_index=False), path,
+                    compression='zstd', row_group_size=ROW_GROUP_SIZE
+                )
+                manifest['files'].append({
+                    'path': relative,
+                    'month': f"{month_start:%Y-%m}",
+                    'rows': len(df),
+                    'min_date': df['sale_date'].min().isoformat(),
+                    'max_date': df['sale_date'].max().isoformat()
+                })
+                report['files'].append(relative)
+                report['archived'] += len(df)
+
+            for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+                session.execute(delete(Sale).where(Sale.id.in_(ids[start:start + DELETE_CHUNK_SIZE])))
+            if report['watermark'] is None or month_end > report['watermark']:
+                report['watermark'] = month_end
+            manifest['watermark'] = report['watermark'].isoformat()
+            # The manifest goes first: a crash before the commit leaves duplicates, never gaps
+            os.makedirs(directory, exist_ok=True)
+            _save_manifest(directory, manifest)
+            session.commit()
+        return report
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -1,17 +1,67 @@
+import math
+import os
+import threading
+import time
 import streamlit as st
+import pandas as pd
+from sqlalchemy import select, update, delete, func, or_
 from models import Session, User
-from datetime import datetime
+from security import hash_password, needs_rehash, verify_password
+from datetime import datetime, timedelta
+
+# Seconds a verified account is trusted before init_auth checks the database again
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL_SECONDS', 30))
+
+# Users per page of the Manage Users listing
+USER_PAGE_SIZE = 25
+
+# Columns of the frames returned by list_users
+USER_COLUMNS = ['id', 'username', 'email', 'is_admin', 'created_at', 'last_login']
+
+# user id -> (expires_at, exists, is_admin), shared by every session in the process
+_verified_users = {}
+_verified_lock = threading.Lock()
+
+def _verify_user(user_id):
+    """Return ``(exists, is_admin)`` for ``user_id``, from the cache while it is fresh."""
+    now = time.monotonic()
+    with _verified_lock:
+        cached = _verified_users.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1], cached[2]
+
+    session = Session()
+    try:
+        row = session.execute(select(User.is_admin).where(User.id == user_id)).first()
+    finally:
+        session.close()
+    exists, is_admin = row is not None, bool(row and row.is_admin)
+    with _verified_lock:
+        _verified_users[user_id] = (now + AUTH_CACHE_TTL, exists, is_admin)
+    return exists, is_admin
+
+def invalidate_user(user_id=None):
+    """Drop the cached verification of ``user_id``, or of every user when None.
+
+    Call after deleting a user or changing their role so the change
+    applies on their next rerun instead of after the TTL.
+    """
+    with _verified_lock:
+        if user_id is None:
+            _verified_users.clear()
+        else:
+            _verified_users.pop(user_id, None)
 
 def init_auth():
     if 'user' not in st.session_state:
         st.session_state.user = None
     elif st.session_state.user:
-        # Verify user still exists in database
-        session = Session()
-        user = session.query(User).filter_by(id=st.session_state.user['id']).first()
-        session.close()
-        if not user:
+        # Verify user still exists in database, and pick up role changes
+        exists, is_admin = _verify_user(st.session_state.user['id'])
+        if not exists:
             st.session_state.user = None
+        elif st.session_state.user.get('is_admin') != is_admin:
+            st.session_state.user = dict(st.session_state.user, is_admin=is_admin)
 
 def register_user(username, email, password, is_admin=False):
     session = Session()
@@ -39,26 +89,148 @@ def register_user(username, email, password, is_admin=False):
     finally:
         session.close()
 
-def login_user(username, password):
+def _user_filters(search=None, is_admin=None, last_login_after=None, last_login_before=None, never_logged_in=False):
+    filters = []
+    if search:
+        term = search.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        filters.append(or_(
+            User.username.ilike(f'%{term}%', escape='\\'),
+            User.email.ilike(f'%{term}%', escape='\\')
+        ))
+    if is_admin is not None:
+        filters.append(User.is_admin == is_admin)
+    if last_login_after:
+        filters.append(User.last_login >= last_login_after)
+    if last_login_before:
+        # Users who never logged in haven't logged in since either
+        filters.append(or_(User.last_login < last_login_before, User.last_login.is_(None)))
+    if never_logged_in:
+        filters.append(User.last_login.is_(None))
+    return filters
+
+def list_users(search=None, is_admin=None, last_login_after=None, last_login_before=None,
+               never_logged_in=False, after=None, page_size=USER_PAGE_SIZE):
+    """Return one page of users ordered by username, and the cursor of the next page.
+
+    ``search`` matches anywhere in the username or email, ignoring case.
+    ``last_login_before`` includes users who never logged in. Pages seek on
+    the username like get_sales_page does on sale date; pass the returned
+    cursor back as ``after``, it is None on the last page.
+    """
+    session = Session()
+    try:
+        query = select(*(getattr(User, column) for column in USER_COLUMNS)).where(
+            *_user_filters(search, is_admin, last_login_after, last_login_before, never_logged_in)
+        )
+        if after is not None:
+            query = query.where(User.username > after)
+        rows = session.execute(query.order_by(User.username).limit(page_size + 1)).all()
+    finally:
+        session.close()
+    next_cursor = rows[page_size - 1].username if len(rows) > page_size else None
+    return pd.DataFrame(rows[:page_size], columns=USER_COLUMNS), next_cursor
+
+def count_users(search=None, is_admin=None, last_login_after=None, last_login_before=None, never_logged_in=False):
+    session = Session()
+    try:
+        return session.execute(
+            select(func.count(User.id)).where(
+                *_user_filters(search, is_admin, last_login_after, last_login_before, never_logged_in)
+            )
+        ).scalar()
+    finally:
+        session.close()
+
+def set_user_roles(user_ids, is_admin):
+    """Grant or revoke admin for every user in ``user_ids`` with one UPDATE."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return False, "No users selected"
+    session = Session()
+    try:
+        result = session.execute(
+            update(User).where(User.id.in_(user_ids)).values(is_admin=is_admin)
+        )
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        return False, str(e)
+    finally:
+        session.close()
+    for user_id in user_ids:
+        invalidate_user(user_id)
+    return True, f"Updated the role of {result.rowcount} user(s)"
+
+def delete_users(user_ids):
+    """Delete every user in ``user_ids`` with one DELETE."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return False, "No users selected"
     session = Session()
     try:
-        user = session.query(User).filter(User.username == username).first()
-        if user and user.check_password(password):
-            user.last_login = datetime.now()
-            session.commit()
-            st.session_state.user = {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'is_admin': user.is_admin
-            }
-            return True, "Login successful"
-        return False, "Invalid username or password"
+        result = session.execute(delete(User).where(User.id.in_(user_ids)))
+        session.commit()
     except Exception as e:
         session.rollback()
         return False, str(e)
     finally:
         session.close()
+    for user_id in user_ids:
+        invalidate_user(user_id)
+    return True, f"Deleted {result.rowcount} user(s)"
+
+def authenticate(username, password):
+    """Check a username and password; returns the user's session dict, or None.
+
+    A hash made with an outdated method or cost is replaced while the
+    plain password is at hand, so users move to the current settings as
+    they log in. Hashing runs with no connection checked out, so logins
+    waiting on the hash pool never hold database connections.
+    """
+    session = Session()
+    try:
+        user = session.execute(
+            select(User.id, User.username, User.email, User.is_admin, User.password_hash)
+            .where(User.username == username)
+        ).first()
+    finally:
+        session.close()
+    if not user or not verify_password(user.password_hash, password):
+        return None
+    new_hash = hash_password(password) if needs_rehash(user.password_hash) else None
+
+    session = Session()
+    try:
+        session.execute(update(User).where(User.id == user.id).values(last_login=datetime.now()))
+        if new_hash:
+            # Skipped if the password changed while we were hashing
+            session.execute(
+                update(User)
+                .where(User.id == user.id, User.password_hash == user.password_hash)
+                .values(password_hash=new_hash)
+            )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'is_admin': user.is_admin
+    }
+
+def login_user(username, password):
+    try:
+        user = authenticate(username, password)
+    except Exception as e:
+        return False, str(e)
+    if user:
+        st.session_state.user = user
+        return True, "Login successful"
+    return False, "Invalid username or password"
 
 def logout_user():
     st.session_state.user = None
@@ -168,67 +340,144 @@ def show_login_page():
             with all_tabs[tab_index]:
                 require_admin()  # Ensure only admins can access this tab
                 st.markdown("<div class='form-container'>", unsafe_allow_html=True)
-        
-        # User creation form
-        with st.form("create_user_form"):
-            st.markdown("### 👥 Create New User")
-            new_username = st.text_input("Username", placeholder="Choose a username")
-            new_email = st.text_input("Email", placeholder="Enter email")
-            new_password = st.text_input("Password", type="password", placeholder="Choose a password")
-            confirm_password = st.text_input("Confirm Password", type="password", placeholder="Confirm password")
-            is_admin = st.checkbox("Grant Admin Access")
-
-            col1, col2, col3 = st.columns([1, 2, 1])
-            with col2:
-                create_button = st.form_submit_button("➕ Create User", 
-                    use_container_width=True)
-
-            if create_button:
-                if new_username and new_email and new_password and confirm_password:
-                    if new_password != confirm_password:
-                        st.error("❌ Passwords do not match")
-                    else:
-                        success, message = register_user(new_username, new_email, new_password, is_admin)
-                        if success:
-                            st.success("🎉 " + message)
-                            st.rerun()
-                        else:
-                            st.error("❌ " + message)
-                else:
-                    st.error("⚠️ Please fill in all fields")
-        
-        # Display existing users with edit functionality
-        st.markdown("### 📋 Existing Users")
-        session = Session()
-        users = session.query(User).all()
-        for user in users:
-            with st.expander(f"👤 {user.username}"):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"📧 Email: {user.email}")
-                    st.write("🔑 Admin" if user.is_admin else "👥 Regular User")
-                with col2:
-                    new_admin_status = st.checkbox("Admin Access", value=user.is_admin, key=f"admin_{user.id}")
-                    if st.button("Update Role", key=f"update_{user.id}"):
-                        user.is_admin = new_admin_status
-                        session.commit()
-                        st.success("User role updated successfully!")
-                        st.rerun()
-                    
-                    if st.button("Delete User", key=f"delete_{user.id}"):
-                        if user.id != st.session_state.user.get('id'):
-                            session.delete(user)
-                            session.commit()
-                            st.success("User deleted successfully!")
-                            st.rerun()
-                        else:
-                            st.error("Cannot delete your own account!")
-        session.close()
-        st.markdown("</div>", unsafe_allow_html=True)
+                show_user_management()
+                st.markdown("</div>", unsafe_allow_html=True)
 
     # Footer
     st.markdown("""
         <div style='text-align: center; margin-top: 20px; color: #566573'>
             <p>Secure login powered by Austin Phones and Gadgets IMS</p>
         </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """, unsafe_allow_html=True)
+
+def _last_login_filter(choice):
+    now = datetime.now()
+    if choice == "In the last 30 days":
+        return {'last_login_after': now - timedelta(days=30)}
+    if choice == "Not in the last 90 days":
+        return {'last_login_before': now - timedelta(days=90)}
+    if choice == "Never":
+        return {'never_logged_in': True}
+    return {}
+
+def show_user_management():
+    # User creation form
+    with st.form("create_user_form"):
+        st.markdown("### 👥 Create New User")
+        new_username = st.text_input("Username", placeholder="Choose a username")
+        new_email = st.text_input("Email", placeholder="Enter email")
+        new_password = st.text_input("Password", type="password", placeholder="Choose a password")
+        confirm_password = st.text_input("Confirm Password", type="password", placeholder="Confirm password")
+        is_admin = st.checkbox("Grant Admin Access")
+
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            create_button = st.form_submit_button("➕ Create User", 
+                use_container_width=True)
+
+        if create_button:
+            if new_username and new_email and new_password and confirm_password:
+                if new_password != confirm_password:
+                    st.error("❌ Passwords do not match")
+                else:
+                    success, message = register_user(new_username, new_email, new_password, is_admin)
+                    if success:
+                        st.success("🎉 " + message)
+                        st.rerun()
+                    else:
+                        st.error("❌ " + message)
+            else:
+                st.error("⚠️ Please fill in all fields")
+
+    # Existing users, one page at a time
+    st.markdown("### 📋 Existing Users")
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        search = st.text_input("Search", placeholder="Username or email", key='user_search')
+    with col2:
+        role = st.selectbox("Role", ["All", "Admins", "Regular users"], key='user_role_filter')
+    with col3:
+        last_login = st.selectbox(
+            "Last Login",
+            ["Any time", "In the last 30 days", "Not in the last 90 days", "Never"],
+            key='user_login_filter'
+        )
+
+    query = {'search': search.strip() or None, **_last_login_filter(last_login)}
+    if role != "All":
+        query['is_admin'] = role == "Admins"
+
+    # Filters are part of the key so a new search starts again from the first page
+    query_key = (query.get('search'), role, last_login)
+    if st.session_state.get('user_admin_query') != query_key:
+        st.session_state.user_admin_query = query_key
+        st.session_state.user_admin_cursors = [None]
+    cursors = st.session_state.user_admin_cursors
+
+    users_df, next_cursor = list_users(after=cursors[-1], **query)
+    if users_df.empty:
+        st.info("No users match these filters.")
+        return
+
+    edited = st.data_editor(
+        users_df.assign(selected=False).set_index('id'),
+        column_order=['selected', 'username', 'email', 'is_admin', 'last_login', 'created_at'],
+        column_config={
+            'selected': st.column_config.CheckboxColumn("Select"),
+            'username': "Username",
+            'email': "Email",
+            'is_admin': st.column_config.CheckboxColumn("Admin"),
+            'last_login': st.column_config.DatetimeColumn("Last Login"),
+            'created_at': st.column_config.DatetimeColumn("Created")
+        },
+        disabled=['username', 'email', 'is_admin', 'last_login', 'created_at'],
+        use_container_width=True,
+        key=f'user_admin_editor_{len(cursors)}'
+    )
+    selected = [int(user_id) for user_id in edited.index[edited['selected']]]
+
+    total = count_users(**query)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("◀ Previous", disabled=len(cursors) == 1, key='user_admin_previous'):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Page {len(cursors)} of {max(1, math.ceil(total / USER_PAGE_SIZE))} · {total:,} users")
+    with col3:
+        if st.button("Next ▶", disabled=next_cursor is None, key='user_admin_next'):
+            cursors.append(next_cursor)
+            st.rerun()
+
+    own_id = st.session_state.user.get('id')
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("Grant Admin", disabled=not selected):
+            success, message = set_user_roles(selected, True)
+            if success:
+                st.success(message)
+                st.rerun()
+            else:
+                st.error(message)
+    with col2:
+        if st.button("Revoke Admin", disabled=not selected):
+            if own_id in selected:
+                st.error("Cannot revoke your own admin access!")
+            else:
+                success, message = set_user_roles(selected, False)
+                if success:
+                    st.success(message)
+                    st.rerun()
+                else:
+                    st.error(message)
+    with col3:
+        if st.button("Delete Users", disabled=not selected):
+            if own_id in selected:
+                st.error("Cannot delete your own account!")
+            else:
+                success, message = delete_users(selected)
+                if success:
+                    st.success(message)
+                    st.rerun()
+                else:
+                    st.error(message)
@@ -0,0 +1,742 @@
+"""Benchmarks for the inventory data layer.
+
+Every benchmark runs against scratch tables, never the live ones: on
+PostgreSQL they are created in a throwaway schema that is dropped at the
+end, on SQLite in a scratch file. The target defaults to
+BENCH_DATABASE_URL, or sqlite:///bench.db when that is unset. The sales
+archive is pointed at an empty temporary directory for the run, so the
+live Parquet files never mix into scratch results.
+
+Usage:
+    python benchmark.py indexes [--url URL] [--phones N] [--sales N]
+    python benchmark.py loaders [--url URL] [--sizes N [N ...]]
+    python benchmark.py stress-sale [--url URL] [--threads N] [--sales-per-thread N] [--cart]
+    python benchmark.py startup [--module NAME] [--repeat N] [--top N]
+    python benchmark.py logins [--url URL] [--users N] [--threads N] [--workers N [N ...]]
+    python benchmark.py suite [--url URL] [--phones N] [--sales N] [--output FILE] [--baseline FILE]
+    python benchmark.py forecast [--url URL] [--phones N] [--days N] [--density F]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import func, insert, select, text
+
+import archive
+import utils
+from database import create_engine_from_env, pool_status
+import security
+from models import DATABASE_URL, Base, DailySalesRollup, PaymentMethod, Phone, Sale, Session, Transaction, TransactionType, User
+
+BENCH_SCHEMA = 'invento_bench'
+BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+SEED_CHUNK_SIZE = 10000
+
+
+def _bench_engine(url):
+    if url.startswith('postgresql'):
+        with create_engine_from_env(url).begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {BENCH_SCHEMA}"))
+        return create_engine_from_env(url, search_path=BENCH_SCHEMA)
+    if url == DATABASE_URL:
+        raise SystemExit("Refusing to benchmark in the live SQLite database; pass a scratch --url")
+    return create_engine_from_env(url)
+
+
+def _drop_scratch(engine):
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    else:
+        Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def _seed(engine, phones, sales, transactions=None, seed=42, days=365):
+    """Fill the scratch tables with deterministic synthetic data.
+
+    ``transactions`` defaults to half the number of sales.
+    """
+    if transactions is None:
+        transactions = sales // 2
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    brands = ['Apple', 'Samsung', 'Google', 'Xiaomi', 'Tecno', 'Infinix', 'Nokia', 'Oppo']
+    methods = list(PaymentMethod)
+    models = [f"Model {i:07d}" for i in range(phones)]
+    prices = [round(rng.uniform(50, 1500), 2) for _ in range(phones)]
+
+    with engine.begin() as conn:
+        for start in range(0, phones, SEED_CHUNK_SIZE):
+            conn.execute(insert(Phone.__table__), [{
+                'model': models[i],
+                'brand': brands[i % len(brands)],
+                'price': prices[i],
+                'quantity': rng.randint(0, 200),
+                'last_updated': now
+            } for i in range(start, min(start + SEED_CHUNK_SIZE, phones))])
+
+        for start in range(0, sales, SEED_CHUNK_SIZE):
+            rows = []
+            for _ in range(start, min(start + SEED_CHUNK_SIZE, sales)):
+                i = rng.randrange(phones)
+                quantity = rng.randint(1, 3)
+                rows.append({
+                    'phone_model': models[i],
+                    'quantity_sold': quantity,
+                    'unit_price': prices[i],
+                    'total_amount': quantity * prices[i],
+                    'payment_method': rng.choice(methods).name,
+                    'sale_date': now - timedelta(seconds=rng.randrange(days * 86400))
+                })
+            conn.execute(insert(Sale.__table__), rows)
+
+        for start in range(0, transactions, SEED_CHUNK_SIZE):
+            rows = []
+            for _ in range(start, min(start + SEED_CHUNK_SIZE, transactions)):
+                previous = rng.randint(0, 200)
+                change = rng.randint(-3, 20)
+                rows.append({
+                    'phone_model': models[rng.randrange(phones)],
+                    'transaction_type': TransactionType.UPDATE.name,
+                    'quantity_change': change,
+                    'previous_quantity': previous,
+                    'new_quantity': previous + change,
+                    'timestamp': now - timedelta(seconds=rng.randrange(days * 86400))
+                })
+            conn.execute(insert(Transaction.__table__), rows)
+    return models
+
+
+def _time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3)
+    }
+
+
+def _explain(conn, stmt):
+    compiled = stmt.compile(conn, compile_kwargs={'literal_binds': True})
+    if conn.dialect.name == 'postgresql':
+        rows = conn.execute(text(f"EXPLAIN ANALYZE {compiled}")).scalars().all()
+    else:
+        rows = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+    return rows
+
+
+def _analyze(conn):
+    conn.execute(text("ANALYZE"))
+
+
+def _index_queries(models, rng):
+    now = datetime.now()
+    model = rng.choice(models)
+    return {
+        'phone_by_model': select(Phone).where(Phone.model == model),
+        'sales_last_30_days': select(Sale).where(
+            Sale.sale_date >= now - timedelta(days=30), Sale.sale_date <= now
+        ),
+        'sales_for_model': select(func.sum(Sale.quantity_sold)).where(Sale.phone_model == model),
+        'sales_by_model': select(
+            Sale.phone_model, func.sum(Sale.quantity_sold), func.sum(Sale.total_amount)
+        ).group_by(Sale.phone_model),
+        'transactions_for_model': select(Transaction).where(
+            Transaction.phone_model == model
+        ).order_by(Transaction.timestamp.desc()).limit(20)
+    }
+
+
+def bench_indexes(args):
+    """Query plans and timings for the hot lookups with and without the secondary indexes."""
+    engine = _bench_engine(args.url)
+    tables = [Phone.__table__, Sale.__table__, Transaction.__table__]
+    try:
+        Base.metadata.create_all(engine, tables=tables)
+        with engine.begin() as conn:
+            for table in tables:
+                for index in table.indexes:
+                    index.drop(conn)
+        models = _seed(engine, args.phones, args.sales)
+
+        report = {'dialect': engine.dialect.name, 'phones': args.phones, 'sales': args.sales}
+        for label in ('before', 'after'):
+            if label == 'after':
+                with engine.begin() as conn:
+                    for table in tables:
+                        for index in table.indexes:
+                            index.create(conn)
+            with engine.begin() as conn:
+                _analyze(conn)
+                results = {}
+                for name, stmt in _index_queries(models, random.Random(7)).items():
+                    results[name] = {
+                        'plan': _explain(conn, stmt),
+                        **_time(lambda: conn.execute(stmt).all(), args.repeat)
+                    }
+            report[label] = results
+
+        for name in report['before']:
+            before = report['before'][name]['median_ms']
+            after = report['after'][name]['median_ms']
+            report.setdefault('speedup', {})[name] = round(before / after, 2) if after else None
+        print(json.dumps(report, indent=2, default=str))
+    finally:
+        _drop_scratch(engine)
+
+
+def _legacy_load_inventory():
+    # load_inventory as it was before the projected loaders: ORM objects, then one dict per row
+    session = Session()
+    try:
+        phones = session.query(Phone).all()
+        return pd.DataFrame([{
+            'model': phone.model,
+            'brand': phone.brand,
+            'price': phone.price,
+            'quantity': phone.quantity,
+            'last_updated': phone.last_updated
+        } for phone in phones])
+    finally:
+        session.close()
+
+
+def _legacy_get_sales_data():
+    session = Session()
+    try:
+        sales = session.query(Sale).all()
+        return pd.DataFrame([{
+            'sale_date': sale.sale_date,
+            'phone_model': sale.phone_model,
+            'quantity_sold': sale.quantity_sold,
+            'unit_price': sale.unit_price,
+            'total_amount': sale.total_amount,
+            'payment_method': sale.payment_method.value,
+            'customer_name': sale.customer_name,
+            'customer_phone': sale.customer_phone
+        } for sale in sales])
+    finally:
+        session.close()
+
+
+def _same_frame(legacy, projected):
+    # Columns added to the frames since the legacy loaders are not compared
+    if not set(legacy.columns) <= set(projected.columns) or len(legacy) != len(projected):
+        return False
+    # Compare values only: the projected loaders use categorical and datetime64 dtypes on purpose
+    return all(
+        list(legacy[column].astype(str)) == list(projected[column].astype(str))
+        for column in legacy.columns
+    )
+
+
+def _projected_load_inventory():
+    # The uncached read behind load_inventory
+    session = Session()
+    try:
+        return utils._read_inventory(session)
+    finally:
+        session.close()
+
+
+def bench_loaders(args):
+    """Legacy ORM-hydrating loaders against the column-projected ones."""
+    loaders = {
+        'load_inventory': (_legacy_load_inventory, _projected_load_inventory),
+        'get_sales_data': (_legacy_get_sales_data, utils.get_sales_data)
+    }
+    report = {'dialect': None, 'sizes': {}}
+    for size in args.sizes:
+        engine = _bench_engine(args.url)
+        report['dialect'] = engine.dialect.name
+        Session.configure(bind=engine)
+        try:
+            Base.metadata.create_all(engine, tables=[Phone.__table__, Sale.__table__])
+            _seed(engine, size, size, transactions=0)
+            results = {}
+            for name, (legacy, projected) in loaders.items():
+                legacy_timing = _time(legacy, args.repeat)
+                projected_timing = _time(projected, args.repeat)
+                results[name] = {
+                    'legacy': dict(legacy_timing, rows_per_sec=round(size / legacy_timing['median_ms'] * 1000)),
+                    'projected': dict(projected_timing, rows_per_sec=round(size / projected_timing['median_ms'] * 1000)),
+                    'speedup': round(legacy_timing['median_ms'] / projected_timing['median_ms'], 2),
+                    'same_result': _same_frame(legacy(), projected())
+                }
+            report['sizes'][size] = results
+        finally:
+            _drop_scratch(engine)
+    print(json.dumps(report, indent=2))
+
+
+def bench_stress_sale(args):
+    """Many threads selling the same SKUs: checks the stock counts stay exact and measures throughput.
+
+    With ``--cart`` every attempt is a two-line record_cart_sale of one unit
+    each of two models, lines in random order, so overlapping carts race on
+    both rows.
+    """
+    engine = _bench_engine(args.url)
+    Session.configure(bind=engine)
+    attempts = args.threads * args.sales_per_thread
+    models = ['Stress Phone', 'Stress Phone 2'] if args.cart else ['Stress Phone']
+    # Stock for about half the attempts, so both the success and the sold-out paths are exercised
+    stock = args.stock if args.stock is not None else attempts // 2
+    try:
+        Base.metadata.create_all(engine, tables=[
+            Phone.__table__, Sale.__table__, DailySalesRollup.__table__, Transaction.__table__
+        ])
+        with engine.begin() as conn:
+            conn.execute(insert(Phone.__table__), [{
+                'model': model, 'brand': 'Bench', 'price': 100.0, 'quantity': stock, 'last_updated': datetime.now()
+            } for model in models])
+
+        barrier = threading.Barrier(args.threads)
+        latencies = []
+        outcomes = {'sold': 0, 'insufficient': 0, 'errors': {}}
+        lock = threading.Lock()
+
+        def sell():
+            barrier.wait()
+            for _ in range(args.sales_per_thread):
+                start = time.perf_counter()
+                if args.cart:
+                    lines = [(model, 1, 100.0) for model in random.sample(models, len(models))]
+                    success, message = utils.record_cart_sale(lines, PaymentMethod.CASH)
+                else:
+                    success, message = utils.record_sale('Stress Phone', 1, 100.0, PaymentMethod.CASH)
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    if success:
+                        outcomes['sold'] += 1
+                    elif message.startswith("Insufficient stock"):
+                        outcomes['insufficient'] += 1
+                    else:
+                        outcomes['errors'][message] = outcomes['errors'].get(message, 0) + 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            for future in [pool.submit(sell) for _ in range(args.threads)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+
+        with engine.connect() as conn:
+            remaining = dict(conn.execute(select(Phone.model, Phone.quantity).where(Phone.model.in_(models))).all())
+            sale_rows = conn.execute(select(func.count(Sale.id))).scalar()
+            rollup_units = conn.execute(select(func.sum(DailySalesRollup.units_sold))).scalar() or 0
+
+        # Every successful attempt sells one unit of each model
+        units = outcomes['sold'] * len(models)
+        latencies.sort()
+        report = {
+            'dialect': engine.dialect.name,
+            'mode': 'cart' if args.cart else 'single',
+            'threads': args.threads,
+            'attempts': attempts,
+            'initial_stock': stock,
+            **outcomes,
+            'remaining_stock': remaining,
+            'sale_rows': sale_rows,
+            'exact': all(remaining[model] == stock - outcomes['sold'] for model in models)
+                     and sale_rows == units == rollup_units and min(remaining.values()) >= 0,
+            'sales_per_sec': round(outcomes['sold'] / elapsed, 1),
+            'attempts_per_sec': round(attempts / elapsed, 1),
+            'p50_ms': round(latencies[len(latencies) // 2], 3),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95)], 3),
+            'max_ms': round(latencies[-1], 3),
+            'pool': pool_status(engine)
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        _drop_scratch(engine)
+
+
+def _login_round(usernames, password, threads):
+    import auth
+
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        def login(username):
+            begin = time.perf_counter()
+            user = auth.authenticate(username, password)
+            latencies.append((time.perf_counter() - begin) * 1000)
+            return user is not None
+        ok = sum(pool.map(login, usernames))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'logins': ok,
+        'logins_per_sec': round(ok / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2], 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 1),
+        'max_ms': round(latencies[-1], 1)
+    }
+
+
+def bench_logins(args):
+    """Many users logging in at once, as at shift start, for each hashing pool size.
+
+    Accounts start with hashes made by --stale-method, so the first round
+    also measures the transparent rehash; the second logs in with the
+    upgraded hashes.
+    """
+    from werkzeug.security import generate_password_hash
+
+    engine = _bench_engine(args.url)
+    Session.configure(bind=engine)
+    password = 'bench-password'
+    usernames = [f"cashier{i:04d}" for i in range(args.users)]
+    stale_hash = generate_password_hash(password, args.stale_method)
+    report = {'method': security.HASH_METHOD, 'stale_method': args.stale_method,
+              'users': args.users, 'threads': args.threads, 'runs': []}
+    try:
+        Base.metadata.create_all(engine, tables=[User.__table__])
+        with engine.begin() as conn:
+            conn.execute(insert(User.__table__), [
+                {'username': name, 'email': f"{name}@bench", 'password_hash': stale_hash, 'is_admin': False}
+                for name in usernames
+            ])
+
+        for workers in args.workers:
+            security.configure(workers=workers)
+            with engine.begin() as conn:
+                conn.execute(User.__table__.update().values(password_hash=stale_hash))
+            first = _login_round(usernames, password, args.threads)
+            with engine.connect() as conn:
+                first['rehashed'] = conn.execute(
+                    select(func.count(User.id)).where(User.password_hash != stale_hash)
+                ).scalar()
+            second = _login_round(usernames, password, args.threads)
+            report['runs'].append({'workers': workers, 'stale_hashes': first, 'current_hashes': second})
+        print(json.dumps(report, indent=2))
+    finally:
+        _drop_scratch(engine)
+
+
+def _percentile(ordered, q):
+    # Nearest rank, so small samples report a latency that was actually observed
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def _measure(fn, repeat, setup=None):
+    """Call ``fn`` ``repeat`` times; it returns the number of rows it handled.
+
+    ``setup`` runs untimed before each call.
+    """
+    timings, rows = [], 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        rows += fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'p50_ms': round(_percentile(timings, 0.50), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'p99_ms': round(_percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'rows': rows,
+        'rows_per_sec': round(rows / (sum(timings) / 1000), 1) if sum(timings) else None
+    }
+
+
+def _suite_operations(args):
+    rng = random.Random(args.seed)
+    month_ago = datetime.now() - timedelta(days=30)
+
+    def save_inventory():
+        # Change a few percent of the rows, as an edit session in the app would
+        df = utils.load_inventory()
+        changed = rng.sample(range(len(df)), max(1, len(df) * args.changed_percent // 100))
+        df.loc[changed, 'quantity'] += 1
+        utils.save_inventory(df)
+        return len(changed)
+
+    def record_sale():
+        model = rng.choice(in_stock)
+        success, message = utils.record_sale(model, 1, 100.0, PaymentMethod.CASH)
+        if not success:
+            raise RuntimeError(f"record_sale failed for {model}: {message}")
+        return 1
+
+    in_stock = utils.load_inventory().query('quantity > 100')['model'].tolist()
+    return {
+        'load_inventory': (lambda: len(utils.load_inventory()), utils.invalidate_inventory_cache, args.repeat),
+        'load_inventory_cached': (lambda: len(utils.load_inventory()), None, args.repeat),
+        'save_inventory': (save_inventory, None, args.repeat),
+        'record_sale': (record_sale, None, args.sale_repeat),
+        'get_sales_data': (lambda: len(utils.get_sales_data()), None, args.repeat),
+        'get_sales_data_30_days': (lambda: len(utils.get_sales_data(start_date=month_ago)), None, args.repeat),
+        'get_sales_summary': (lambda: len(utils.get_sales_summary()['sales_by_model']), None, args.repeat)
+    }
+
+
+def _compare(results, baseline, tolerance):
+    """p50 of every operation against the baseline report; returns the regressions."""
+    comparison, regressions = {}, []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        verdict = 'slower' if ratio > 1 + tolerance else 'faster' if ratio < 1 - tolerance else 'same'
+        comparison[name] = {
+            'baseline_p50_ms': before['p50_ms'],
+            'p50_ms': result['p50_ms'],
+            'ratio': round(ratio, 3),
+            'verdict': verdict
+        }
+        if verdict == 'slower':
+            regressions.append(name)
+    return comparison, regressions
+
+
+def bench_suite(args):
+    """Time the hot paths of the data layer on deterministic synthetic data.
+
+    Prints a JSON report of latency percentiles and rows/sec per
+    operation; --output saves it and --baseline compares against a saved
+    report, exiting non-zero when an operation got slower than --tolerance.
+    """
+    engine = _bench_engine(args.url)
+    Session.configure(bind=engine)
+    utils.invalidate_inventory_cache()
+    try:
+        Base.metadata.create_all(engine)
+        start = time.perf_counter()
+        _seed(engine, args.phones, args.sales, transactions=0, seed=args.seed)
+        utils.rebuild_sales_rollup()
+        seed_seconds = time.perf_counter() - start
+
+        results = {
+            name: _measure(fn, repeat, setup)
+            for name, (fn, setup, repeat) in _suite_operations(args).items()
+        }
+        report = {
+            'dialect': engine.dialect.name,
+            'phones': args.phones,
+            'sales': args.sales,
+            'seed': args.seed,
+            'seed_seconds': round(seed_seconds, 1),
+            'results': results
+        }
+        regressions = []
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            if (baseline.get('dialect'), baseline.get('phones'), baseline.get('sales')) != (
+                    report['dialect'], args.phones, args.sales):
+                report['baseline_warning'] = "Baseline was taken on a different database or data size"
+            report['comparison'], regressions = _compare(results, baseline, args.tolerance)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
+    finally:
+        utils.invalidate_inventory_cache()
+        _drop_scratch(engine)
+    if regressions:
+        raise SystemExit(f"Slower than baseline: {', '.join(regressions)}")
+
+
+def _seed_rollup(engine, models, days, density, seed=42):
+    """Fill sales_daily_rollup directly: each model sells on about ``density`` of the days."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    today = datetime.now().date()
+    rows = 0
+    with engine.begin() as conn:
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            sold = np.flatnonzero(rng.random(len(models)) < density)
+            units = rng.poisson(2, len(sold)) + 1
+            batch = [
+                {'day': day, 'phone_model': models[i], 'units_sold': int(u), 'revenue': float(u) * 100.0, 'sale_count': int(u)}
+                for i, u in zip(sold, units)
+            ]
+            for start in range(0, len(batch), SEED_CHUNK_SIZE):
+                conn.execute(insert(DailySalesRollup.__table__), batch[start:start + SEED_CHUNK_SIZE])
+            rows += len(batch)
+    return rows
+
+
+def bench_forecast(args):
+    """forecast_demand over every SKU, on a rollup seeded with --days of sparse daily sales."""
+    import forecast
+
+    engine = _bench_engine(args.url)
+    Session.configure(bind=engine)
+    try:
+        Base.metadata.create_all(engine, tables=[Phone.__table__, DailySalesRollup.__table__])
+        models = _seed(engine, args.phones, 0, transactions=0)
+        rollup_rows = _seed_rollup(engine, models, args.days, args.density)
+
+        result = {}
+        timing = _time(lambda: result.update(df=forecast.forecast_demand(lookback_days=args.days)), args.repeat)
+        df = result['df']
+        report = {
+            'dialect': engine.dialect.name,
+            'phones': args.phones,
+            'days': args.days,
+            'rollup_rows': rollup_rows,
+            'forecast': timing,
+            'suggestions': int(((df['suggested_order'] > 0) & (df['quantity'] <= df['reorder_point'])).sum())
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        _drop_scratch(engine)
+
+
+def _run_python(*args):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def _import_times(module):
+    """Run ``python -X importtime -c "import module"`` once.
+
+    Returns the wall time of the whole process, the cumulative import time
+    of ``module`` and its direct imports as ``(name, ms)`` pairs, in ms.
+    """
+    wall_ms, result = _run_python('-X', 'importtime', '-c', f"import {module}")
+
+    # Lines are printed children first: "import time: self | cumulative |   name",
+    # indented two spaces per level of nesting
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1000))
+
+    target = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == module)
+    first = max((i for i, (depth, _, _) in enumerate(entries[:target]) if depth == 0), default=-1) + 1
+    children = [(name, ms) for depth, name, ms in entries[first:target] if depth == 1]
+    return wall_ms, entries[target][2], children
+
+
+def bench_startup(args):
+    """Cold import cost of the app, which every new Streamlit session's first render waits on."""
+    interpreter_ms = statistics.median(_run_python('-c', 'pass')[0] for _ in range(args.repeat))
+
+    walls, imports, children = [], [], {}
+    for _ in range(args.repeat):
+        wall_ms, import_ms, direct = _import_times(args.module)
+        walls.append(wall_ms)
+        imports.append(import_ms)
+        for name, ms in direct:
+            children.setdefault(name, []).append(ms)
+
+    heaviest = sorted(
+        ((name, statistics.median(times)) for name, times in children.items()),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+    report = {
+        'module': args.module,
+        'repeat': args.repeat,
+        'python': sys.version.split()[0],
+        'interpreter_ms': round(interpreter_ms, 1),
+        'process_ms': round(statistics.median(walls), 1),
+        'import_ms': round(statistics.median(imports), 1),
+        'heaviest_imports': [{'module': name, 'ms': round(ms, 1)} for name, ms in heaviest]
+    }
+    print(json.dumps(report, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    indexes_parser = subparsers.add_parser('indexes', help="Compare query plans with and without indexes")
+    indexes_parser.add_argument('--url', default=BENCH_DATABASE_URL, help="Scratch database URL (default: BENCH_DATABASE_URL)")
+    indexes_parser.add_argument('--phones', type=int, default=5000)
+    indexes_parser.add_argument('--sales', type=int, default=200000)
+    indexes_parser.add_argument('--repeat', type=int, default=5)
+    indexes_parser.set_defaults(func=bench_indexes)
+
+    loaders_parser = subparsers.add_parser('loaders', help="Compare ORM and column-projected DataFrame loaders")
+    loaders_parser.add_argument('--url', default=BENCH_DATABASE_URL, help="Scratch database URL (default: BENCH_DATABASE_URL)")
+    loaders_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    loaders_parser.add_argument('--repeat', type=int, default=3)
+    loaders_parser.set_defaults(func=bench_loaders)
+
+    stress_parser = subparsers.add_parser('stress-sale', help="Concurrent record_sale or record_cart_sale calls on the same SKUs")
+    stress_parser.add_argument('--url', default=BENCH_DATABASE_URL, help="Scratch database URL (default: BENCH_DATABASE_URL)")
+    stress_parser.add_argument('--threads', type=int, default=16)
+    stress_parser.add_argument('--sales-per-thread', type=int, default=50)
+    stress_parser.add_argument('--stock', type=int, help="Starting stock (default: half the attempted sales)")
+    stress_parser.add_argument('--cart', action='store_true', help="Sell two-line carts through record_cart_sale")
+    stress_parser.set_defaults(func=bench_stress_sale)
+
+    startup_parser = subparsers.add_parser('startup', help="Cold import time of the app, from python -X importtime")
+    startup_parser.add_argument('--module', default='app', help="Module to import (default: app)")
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.add_argument('--top', type=int, default=10, help="Heaviest direct imports to list")
+    startup_parser.set_defaults(func=bench_startup)
+
+    logins_parser = subparsers.add_parser('logins', help="Concurrent login throughput on the password hashing pool")
+    logins_parser.add_argument('--url', default=BENCH_DATABASE_URL, help="Scratch database URL (default: BENCH_DATABASE_URL)")
+    logins_parser.add_argument('--users', type=int, default=64)
+    logins_parser.add_argument('--threads', type=int, default=32, help="Concurrent logins")
+    logins_parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}),
+                               help="Hashing pool sizes to compare")
+    logins_parser.add_argument('--stale-method', default='pbkdf2:sha256:100000',
+                               help="Method of the seeded hashes, which logins upgrade")
+    logins_parser.set_defaults(func=bench_logins)
+
+    suite_parser = subparsers.add_parser('suite', help="Latency and throughput of the data layer's hot paths")
+    suite_parser.add_argument('--url', default=BENCH_DATABASE_URL, help="Scratch database URL (default: BENCH_DATABASE_URL)")
+    suite_parser.add_argument('--phones', type=int, default=10000, help="Up to 100000 for a full-size run")
+    suite_parser.add_argument('--sales', type=int, default=200000, help="Up to 10000000 for a full-size run")
+    suite_parser.add_argument('--seed', type=int, default=42)
+    suite_parser.add_argument('--repeat', type=int, default=10, help="Runs per read or bulk operation")
+    suite_parser.add_argument('--sale-repeat', type=int, default=200, help="Sales recorded one at a time")
+    suite_parser.add_argument('--changed-percent', type=int, default=2, help="Rows changed per save_inventory run")
+    suite_parser.add_argument('--output', help="Save the report as JSON, e.g. as a baseline")
+    suite_parser.add_argument('--baseline', help="Compare against a saved report")
+    suite_parser.add_argument('--tolerance', type=float, default=0.10, help="Relative p50 change treated as noise")
+    suite_parser.set_defaults(func=bench_suite)
+
+    forecast_parser = subparsers.add_parser('forecast', help="Demand forecast over every SKU")
+    forecast_parser.add_argument('--url', default=BENCH_DATABASE_URL, help="Scratch database URL (default: BENCH_DATABASE_URL)")
+    forecast_parser.add_argument('--phones', type=int, default=50000)
+    forecast_parser.add_argument('--days', type=int, default=730, help="Days of history, also the lookback")
+    forecast_parser.add_argument('--density', type=float, default=0.05, help="Share of days each model sells on")
+    forecast_parser.add_argument('--repeat', type=int, default=3)
+    forecast_parser.set_defaults(func=bench_forecast)
+
+    args = parser.parse_args(argv)
+    live_archive = archive.ARCHIVE_DIR
+    with tempfile.TemporaryDirectory(prefix='invento-bench-archive-') as scratch_archive:
+        archive.ARCHIVE_DIR = scratch_archive
+        try:
+            args.func(args)
+        finally:
+            archive.ARCHIVE_DIR = live_archive
+
+
+if __name__ == "__main__":
+    main()
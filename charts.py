@@ -0,0 +1,231 @@
+"""Chart data and figures for the dashboard and reports.
+
+Charts never plot one mark per model straight from the inventory frame.
+Their data is aggregated in SQL, either to the top N models plus an
+"Other" bucket or to one mark per brand. When a chart really does need
+more than WEBGL_THRESHOLD marks it is drawn with WebGL (Scattergl)
+instead of SVG.
+
+Built figures are cached as JSON, shared by every session, until the data
+behind them changes. Inventory charts check max(last_updated) and the row
+count; sales charts check max(sales.id) and the sales_history cache
+version. Each stamp is probed at most every CHART_CACHE_PROBE_SECONDS.
+The JSON is what gets cached, not the Figure, so sessions never share a
+mutable object.
+
+Environment variables:
+    CHART_CACHE_PROBE_SECONDS  seconds between checks of a chart's data
+                               stamp (default 2)
+"""
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import func, select
+
+from models import Session, DailySalesRollup, Phone, Sale, CacheVersion, SALES_HISTORY_CACHE
+from utils import _inventory_stamp, inventory_version
+
+# Models charted individually before the rest are summed into "Other"
+TOP_N = 20
+
+# Marks above which scatter traces switch to WebGL
+WEBGL_THRESHOLD = 1000
+
+# Seconds between data stamp checks for each source
+CHART_PROBE_INTERVAL = float(os.getenv('CHART_CACHE_PROBE_SECONDS', '2'))
+
+_chart_lock = threading.Lock()
+# (chart, params) -> (stamp, figure JSON)
+_figures = {}
+# source -> (stamp, probed_at)
+_stamps = {}
+
+
+def _probe(source):
+    session = Session()
+    try:
+        if source == 'inventory':
+            return _inventory_stamp(session) + (inventory_version(),)
+        return tuple(session.execute(select(
+            select(func.max(Sale.id)).scalar_subquery(),
+            select(CacheVersion.version).where(CacheVersion.name == SALES_HISTORY_CACHE).scalar_subquery()
+        )).one())
+    finally:
+        session.close()
+
+
+def _stamp(source):
+    now = time.monotonic()
+    with _chart_lock:
+        stamp, probed_at = _stamps.get(source, (None, 0.0))
+    if stamp is not None and now - probed_at < CHART_PROBE_INTERVAL:
+        # inventory_version moves on local writes without waiting for the probe
+        if source != 'inventory' or stamp[-1] == inventory_version():
+            return stamp
+    stamp = _probe(source)
+    with _chart_lock:
+        _stamps[source] = (stamp, now)
+    return stamp
+
+
+def _cached_figure(chart, source, params, build):
+    """Return figure ``chart`` as a dict, rebuilding it only when ``source`` data changed."""
+    stamp = _stamp(source)
+    key = (chart, params)
+    with _chart_lock:
+        cached = _figures.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, build().to_json())
+        with _chart_lock:
+            _figures[key] = cached
+    return json.loads(cached[1])
+
+
+def invalidate_chart_cache():
+    with _chart_lock:
+        _figures.clear()
+        _stamps.clear()
+
+
+def stock_by_model(top=TOP_N):
+    """Stock of the ``top`` best-stocked models and the rest summed as "Other (n models)"."""
+    session = Session()
+    try:
+        rows = session.execute(
+            select(Phone.model, Phone.brand, Phone.quantity)
+            .order_by(Phone.quantity.desc(), Phone.model)
+            .limit(top)
+        ).all()
+        total_quantity, total_models = session.execute(
+            select(func.coalesce(func.sum(Phone.quantity), 0), func.count(Phone.id))
+        ).one()
+    finally:
+        session.close()
+    df = pd.DataFrame(rows, columns=['model', 'brand', 'quantity'])
+    rest = total_models - len(df)
+    if rest > 0:
+        df.loc[len(df)] = [f"Other ({rest} models)", 'Other', total_quantity - df['quantity'].sum()]
+    return df
+
+
+def stock_by_brand():
+    """Models, units and value in stock per brand."""
+    session = Session()
+    try:
+        rows = session.execute(
+            select(
+                Phone.brand,
+                func.count(Phone.id),
+                func.sum(Phone.quantity),
+                func.sum(Phone.price * Phone.quantity)
+            ).group_by(Phone.brand).order_by(Phone.brand)
+        ).all()
+    finally:
+        session.close()
+    return pd.DataFrame(rows, columns=['brand', 'models', 'quantity', 'value'])
+
+
+def sales_by_model(top=TOP_N):
+    """Units and revenue of the ``top`` models by revenue, the rest summed as "Other (n models)"."""
+    revenue = func.sum(DailySalesRollup.revenue)
+    session = Session()
+    try:
+        rows = session.execute(
+            select(DailySalesRollup.phone_model, func.sum(DailySalesRollup.units_sold), revenue)
+            .group_by(DailySalesRollup.phone_model)
+            .order_by(revenue.desc(), DailySalesRollup.phone_model)
+            .limit(top)
+        ).all()
+        total_units, total_revenue, total_models = session.execute(select(
+            func.coalesce(func.sum(DailySalesRollup.units_sold), 0),
+            func.coalesce(func.sum(DailySalesRollup.revenue), 0),
+            func.count(func.distinct(DailySalesRollup.phone_model))
+        )).one()
+    finally:
+        session.close()
+    df = pd.DataFrame(rows, columns=['model', 'units', 'revenue'])
+    rest = total_models - len(df)
+    if rest > 0:
+        df.loc[len(df)] = [f"Other ({rest} models)", total_units - df['units'].sum(), total_revenue - df['revenue'].sum()]
+    return df
+
+
+def _all_stock():
+    session = Session()
+    try:
+        rows = session.execute(select(Phone.model, Phone.brand, Phone.quantity).order_by(Phone.model)).all()
+    finally:
+        session.close()
+    return pd.DataFrame(rows, columns=['model', 'brand', 'quantity'])
+
+
+def stock_figure(mode='top', top=TOP_N):
+    """Stock Distribution chart: ``mode`` is 'top' (top N + Other), 'brand' or 'all'."""
+    def build():
+        import plotly.graph_objects as go
+
+        if mode == 'brand':
+            df = stock_by_brand()
+            fig = go.Figure(go.Bar(x=df['brand'], y=df['quantity'], customdata=df['models'],
+                                   hovertemplate="%{x}: %{y} units in %{customdata} models<extra></extra>"))
+            return fig.update_layout(title="Stock by Brand", xaxis_title="Brand", yaxis_title="Units")
+        if mode == 'all':
+            df = _all_stock()
+            trace = go.Scattergl if len(df) > WEBGL_THRESHOLD else go.Scatter
+            fig = go.Figure(trace(x=df['model'], y=df['quantity'], mode='markers', text=df['brand'],
+                                  hovertemplate="%{x} (%{text}): %{y}<extra></extra>"))
+            return fig.update_layout(title="Current Stock Levels", xaxis_title="Model", yaxis_title="Units",
+                                     xaxis_showticklabels=len(df) <= TOP_N * 5)
+        df = stock_by_model(top)
+        fig = go.Figure(go.Bar(x=df['model'], y=df['quantity'], text=df['brand'],
+                               hovertemplate="%{x} (%{text}): %{y}<extra></extra>"))
+        return fig.update_layout(title=f"Current Stock Levels, Top {top} Models", xaxis_title="Model", yaxis_title="Units")
+
+    return _cached_figure('stock', 'inventory', (mode, top), build)
+
+
+def inventory_value_figure():
+    """Pie of inventory value per brand."""
+    def build():
+        import plotly.graph_objects as go
+
+        df = stock_by_brand()
+        fig = go.Figure(go.Pie(labels=df['brand'], values=df['value']))
+        return fig.update_layout(title="Inventory Value Distribution by Brand")
+
+    return _cached_figure('inventory_value', 'inventory', (), build)
+
+
+def sales_figures(top=TOP_N):
+    """Revenue bar and units pie for the top ``top`` models plus "Other"."""
+    frames = {}
+
+    def data():
+        # Both figures go stale together, so a rebuild reads the sales once
+        if 'sales' not in frames:
+            frames['sales'] = sales_by_model(top)
+        return frames['sales']
+
+    def build_revenue():
+        import plotly.graph_objects as go
+
+        df = data()
+        return go.Figure(go.Bar(x=df['model'], y=df['revenue'])).update_layout(
+            title=f"Revenue by Model, Top {top}", xaxis_title="Model", yaxis_title="Revenue"
+        )
+
+    def build_units():
+        import plotly.graph_objects as go
+
+        df = data()
+        return go.Figure(go.Pie(labels=df['model'], values=df['units'])).update_layout(
+            title="Units Sold Distribution by Model"
+        )
+
+    return (
+        _cached_figure('sales_revenue', 'sales', (top,), build_revenue),
+        _cached_figure('sales_units', 'sales', (top,), build_units)
+    )
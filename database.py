@@ -0,0 +1,159 @@
+"""Database engine factory configured from the environment.
+
+Environment variables:
+    DATABASE_URL             SQLAlchemy URL (default: sqlite:///data/inventory.db)
+    DB_POOL_SIZE             connections kept open in the pool (default 5)
+    DB_MAX_OVERFLOW          extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT          seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE          seconds before a connection is replaced (default 1800)
+    DB_STATEMENT_TIMEOUT_MS  PostgreSQL statement_timeout, SQLite busy_timeout;
+                             0 disables it (default 30000)
+    DB_SSLMODE               PostgreSQL sslmode (default require)
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+
+DEFAULT_DATABASE_URL = 'sqlite:///data/inventory.db'
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that counts checkouts and how long callers waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkout_depth = threading.local()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'timeouts': 0
+        }
+
+    def _do_get(self):
+        # QueuePool._do_get retries by calling itself; only time the outermost call
+        depth = getattr(self._checkout_depth, 'value', 0)
+        if depth:
+            return super()._do_get()
+
+        self._checkout_depth.value = 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self._stats['timeouts'] += 1
+            raise
+        finally:
+            self._checkout_depth.value = 0
+            waited = (time.perf_counter() - start) * 1000
+            with self._stats_lock:
+                self._stats['checkouts'] += 1
+                # Anything over a millisecond means the pool was empty, not just bookkeeping
+                if waited > 1:
+                    self._stats['waits'] += 1
+                self._stats['total_wait_ms'] += waited
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+def _postgresql_options(statement_timeout_ms, search_path):
+    connect_args = {'sslmode': os.getenv('DB_SSLMODE', 'require')}
+    options = []
+    if statement_timeout_ms:
+        options.append(f'-c statement_timeout={statement_timeout_ms}')
+    if search_path:
+        options.append(f'-c search_path={search_path}')
+    if options:
+        connect_args['options'] = ' '.join(options)
+    return connect_args
+
+
+def _enable_sqlite_wal(engine, busy_timeout_ms, in_memory):
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            # Readers no longer block the writer, and commits skip a full fsync
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        if busy_timeout_ms:
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.close()
+
+
+def create_engine_from_env(url=None, search_path=None, **engine_options):
+    """Create an engine for ``url`` (default: DATABASE_URL) with pool settings from the environment.
+
+    ``search_path`` sets the PostgreSQL schema search path, which the
+    benchmarks use to work in a scratch schema. Extra keyword arguments
+    override the pool settings.
+    """
+    url = url or os.getenv('DATABASE_URL') or DEFAULT_DATABASE_URL
+    statement_timeout_ms = _env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+    backend = make_url(url).get_backend_name()
+
+    options = {'pool_pre_ping': True}
+    if backend == 'sqlite':
+        database = make_url(url).database
+        in_memory = not database or database == ':memory:'
+        if in_memory:
+            # Every connection to :memory: is a new empty database, so share one
+            options.update(poolclass=StaticPool, connect_args={'check_same_thread': False})
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+            options.update(
+                poolclass=InstrumentedQueuePool,
+                pool_size=_env_int('DB_POOL_SIZE', 5),
+                max_overflow=_env_int('DB_MAX_OVERFLOW', 10),
+                pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+                connect_args={'check_same_thread': False}
+            )
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=_env_int('DB_POOL_SIZE', 5),
+            max_overflow=_env_int('DB_MAX_OVERFLOW', 10),
+            pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+            pool_recycle=_env_int('DB_POOL_RECYCLE', 1800)
+        )
+        if backend == 'postgresql':
+            options['connect_args'] = _postgresql_options(statement_timeout_ms, search_path)
+    options.update(engine_options)
+
+    engine = create_engine(url, **options)
+    if backend == 'sqlite':
+        _enable_sqlite_wal(engine, statement_timeout_ms, in_memory)
+    return engine
+
+
+def pool_status(engine):
+    """Pool sizing, current usage and checkout/wait statistics for ``engine``."""
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=pool.overflow(),
+            timeout=pool.timeout()
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        stats = pool.stats()
+        stats['avg_wait_ms'] = stats['total_wait_ms'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        status.update(stats)
+    return status
@@ -0,0 +1,124 @@
+"""Streaming exports of inventory and sales for download.
+
+Rows are read from a server-side cursor in EXPORT_CHUNK_SIZE batches and
+written out incrementally, so exporting years of sales holds one batch in
+memory at a time. The output goes to an anonymous temporary file private
+to the caller instead of a shared file in the working directory.
+"""
+import io
+import itertools
+import os
+import tempfile
+
+from sqlalchemy import select
+
+import archive
+from jobs import set_progress
+from models import Session, Phone, Sale
+from utils import (
+    INVENTORY_DTYPES,
+    SALES_DTYPES,
+    _frame_from_batches,
+    _projected_columns,
+    _sales_filters
+)
+
+# Rows fetched and written per batch
+EXPORT_CHUNK_SIZE = 20000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+def _arrow_schema(dtypes):
+    import pyarrow as pa
+
+    arrow_types = {
+        'float64': pa.float64(),
+        'int64': pa.int64(),
+        'datetime64': pa.timestamp('us')
+    }
+    # Categorical columns are written as plain strings so every batch shares one schema
+    return pa.schema([(column, arrow_types.get(dtype, pa.string())) for column, dtype in dtypes.items()])
+
+
+def _frames(entity, dtypes, filters=()):
+    """Yield the query result as DataFrames of at most EXPORT_CHUNK_SIZE rows."""
+    session = Session()
+    try:
+        query = select(*_projected_columns(session, entity, dtypes)).where(*filters)
+        result = session.connection().execute(
+            query.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+        )
+        for partition in result.partitions():
+            yield _frame_from_batches([partition], dtypes)
+    finally:
+        session.close()
+
+
+def _write_csv(frames, target):
+    text = io.TextIOWrapper(target, encoding='utf-8', newline='')
+    header = True
+    for frame in frames:
+        frame.to_csv(text, header=header, index=False)
+        header = False
+    text.flush()
+    text.detach()
+
+
+def _write_parquet(frames, dtypes, target):
+    # pyarrow is only needed for Parquet exports; keep it off the app's import path
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(dtypes)
+    categorical = [column for column, dtype in dtypes.items() if dtype in ('category', 'payment_method')]
+    with pq.ParquetWriter(target, schema, compression='zstd') as writer:
+        for frame in frames:
+            frame[categorical] = frame[categorical].astype(object)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+
+def _with_progress(frames):
+    # Row count so far for the background job running the export, if any
+    rows = 0
+    for frame in frames:
+        yield frame
+        rows += len(frame)
+        set_progress(None, f"{rows:,} rows written")
+
+
+def _export(entity, dtypes, fmt, filters=(), archived=()):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    # Archived frames, when given, go first: they hold the oldest rows
+    frames = _with_progress(itertools.chain(archived, _frames(entity, dtypes, filters)))
+    with tempfile.NamedTemporaryFile(suffix=f'.{fmt}', delete=False) as target:
+        try:
+            if fmt == 'csv':
+                _write_csv(frames, target)
+            else:
+                _write_parquet(frames, dtypes, target)
+        except Exception:
+            os.unlink(target.name)
+            raise
+    # Hand back a read-only handle and drop the name; the data lives until the handle is closed
+    export_file = open(target.name, 'rb')
+    os.unlink(target.name)
+    return export_file
+
+
+def export_inventory(fmt='csv'):
+    """Write the whole inventory as CSV or Parquet and return the file, rewound."""
+    return _export(Phone, INVENTORY_DTYPES, fmt)
+
+
+def export_sales(fmt='csv', start_date=None, end_date=None, phone_model=None, payment_method=None):
+    """Write the matching sales, archived ones included, as CSV or Parquet and return the file, rewound."""
+    return _export(
+        Sale, SALES_DTYPES, fmt,
+        _sales_filters(start_date, end_date, phone_model, payment_method),
+        archive.iter_sales(list(SALES_DTYPES), start_date, end_date, phone_model, payment_method)
+    )
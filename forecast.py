@@ -0,0 +1,118 @@
+"""Demand forecasts and reorder suggestions for every phone at once.
+
+Daily demand is read from the sales rollup as one row per model (total
+units, sum of squared daily units and first day sold in the window), and
+everything after that is NumPy arithmetic over whole columns. No
+per-model loop, so 50k SKUs cost about the same as 50.
+
+Days without sales count as zero demand, which is why the rollup's sum of
+squares is enough for the variance. A model first sold partway through
+the window is measured from that day, so new lines aren't diluted by the
+days before they existed.
+
+Environment variables:
+    FORECAST_LOOKBACK_DAYS  days of history used (default 90)
+    REORDER_LEAD_DAYS       days from ordering to stock on the shelf (default 7)
+    REORDER_REVIEW_DAYS     days until the next reorder review (default 14)
+    REORDER_SERVICE_Z       safety stock in standard deviations of lead-time
+                            demand; 1.65 covers ~95% of periods (default 1.65)
+"""
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from models import Session, DailySalesRollup, Phone
+
+LOOKBACK_DAYS = int(os.getenv('FORECAST_LOOKBACK_DAYS', '90'))
+LEAD_DAYS = float(os.getenv('REORDER_LEAD_DAYS', '7'))
+REVIEW_DAYS = float(os.getenv('REORDER_REVIEW_DAYS', '14'))
+SERVICE_Z = float(os.getenv('REORDER_SERVICE_Z', '1.65'))
+
+FORECAST_COLUMNS = [
+    'model', 'brand', 'price', 'quantity', 'reorder_threshold', 'daily_demand', 'demand_std',
+    'days_of_cover', 'reorder_point', 'suggested_order', 'order_value'
+]
+
+
+def _read_demand(session, start):
+    query = (
+        select(
+            DailySalesRollup.phone_model,
+            func.sum(DailySalesRollup.units_sold),
+            func.sum(DailySalesRollup.units_sold * DailySalesRollup.units_sold),
+            func.min(DailySalesRollup.day)
+        )
+        .where(DailySalesRollup.day >= start)
+        .group_by(DailySalesRollup.phone_model)
+    )
+    rows = session.connection().execute(query).all()
+    models, units, squares, first_days = zip(*rows) if rows else ((), (), (), ())
+    return pd.DataFrame({
+        'model': pd.Series(models, dtype=object),
+        'units': np.fromiter(units, dtype=np.float64, count=len(rows)),
+        'squares': np.fromiter(squares, dtype=np.float64, count=len(rows)),
+        # SQLite hands back ISO strings, PostgreSQL dates; both parse the same
+        'first_day': pd.to_datetime(pd.Series(first_days, dtype=object))
+    })
+
+
+def forecast_demand(lookback_days=LOOKBACK_DAYS, lead_days=LEAD_DAYS, review_days=REVIEW_DAYS,
+                    service_z=SERVICE_Z, today=None):
+    """Demand rate, variability, cover and a suggested order for every phone.
+
+    Returns a DataFrame with FORECAST_COLUMNS, one row per phone.
+    ``reorder_point`` is expected demand over the lead time plus safety
+    stock; ``suggested_order`` tops stock up to cover the lead time and
+    the review period on top of that safety stock.
+    """
+    today = today or date.today()
+    start = today - timedelta(days=lookback_days - 1)
+    session = Session()
+    try:
+        phones = pd.DataFrame(
+            session.connection().execute(
+                select(Phone.model, Phone.brand, Phone.price, Phone.quantity, Phone.reorder_threshold)
+            ).all(),
+            columns=['model', 'brand', 'price', 'quantity', 'reorder_threshold']
+        )
+        demand = _read_demand(session, start)
+    finally:
+        session.close()
+
+    df = phones.merge(demand, on='model', how='left')
+    units = df['units'].fillna(0).to_numpy()
+    squares = df['squares'].fillna(0).to_numpy()
+    first_day = df['first_day'].fillna(pd.Timestamp(start)).to_numpy('datetime64[D]')
+    days = np.clip((np.datetime64(today, 'D') - first_day).astype(np.int64) + 1, 1, lookback_days)
+
+    mean = units / days
+    std = np.sqrt(np.maximum(squares / days - mean ** 2, 0))
+    quantity = df['quantity'].to_numpy(dtype=np.float64)
+
+    safety_stock = service_z * std * np.sqrt(lead_days)
+    reorder_point = mean * lead_days + safety_stock
+    target = mean * (lead_days + review_days) + safety_stock
+    with np.errstate(divide='ignore'):
+        days_of_cover = np.where(mean > 0, quantity / mean, np.inf)
+
+    df['daily_demand'] = mean
+    df['demand_std'] = std
+    df['days_of_cover'] = days_of_cover
+    df['reorder_point'] = np.ceil(reorder_point).astype(np.int64)
+    df['suggested_order'] = np.maximum(np.ceil(target - quantity), 0).astype(np.int64)
+    df['order_value'] = df['suggested_order'] * df['price']
+    return df[FORECAST_COLUMNS]
+
+
+def reorder_suggestions(limit=None, **options):
+    """Phones at or below their reorder point, shortest cover first.
+
+    Takes the same options as forecast_demand.
+    """
+    df = forecast_demand(**options)
+    due = df[(df['suggested_order'] > 0) & (df['quantity'] <= df['reorder_point'])]
+    due = due.sort_values(['days_of_cover', 'model']).reset_index(drop=True)
+    return due if limit is None else due.head(limit)
@@ -0,0 +1,219 @@
+"""Per-rerun SQL statistics from SQLAlchemy engine events.
+
+``install(engine)`` hooks the engine's cursor events. Inside a
+``track_rerun()`` block every statement run on that thread is counted and
+timed against the current rerun; when the block ends the rerun's totals go
+into a rolling history that the admin Performance page aggregates.
+
+Rows are rows written for INSERT/UPDATE/DELETE plus rows returned by
+SELECT. Both come from the DBAPI rowcount where the driver reports it
+(psycopg2); sqlite3 reports -1 for SELECT, so there the rows are counted
+as the result fetches them, and rows a caller never fetches are left out.
+
+Environment variables:
+    PERF_HISTORY   reruns kept for the Performance page (default 1000)
+    PERF_LOG       path of a JSON-lines file that gets one line per rerun
+                   (default: no log)
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import event
+
+# Slowest statements kept per rerun
+SLOW_STATEMENTS_PER_RERUN = 5
+
+_history = deque(maxlen=int(os.getenv('PERF_HISTORY', 1000)))
+_history_lock = threading.Lock()
+_current = threading.local()
+
+logger = logging.getLogger('invento.performance')
+if os.getenv('PERF_LOG'):
+    _handler = logging.FileHandler(os.getenv('PERF_LOG'))
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class RerunStats:
+    """SQL totals for one Streamlit rerun."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started_at = datetime.now()
+        self.statements = 0
+        self.db_ms = 0.0
+        self.rows = 0
+        self.total_ms = 0.0
+        # Min-heap of (ms, statement) holding the slowest few
+        self.slowest = []
+
+    def record(self, statement, elapsed_ms, rowcount):
+        self.statements += 1
+        self.db_ms += elapsed_ms
+        if rowcount > 0:
+            self.rows += rowcount
+        entry = (elapsed_ms, ' '.join(statement.split()))
+        if len(self.slowest) < SLOW_STATEMENTS_PER_RERUN:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def as_dict(self):
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'page': self.page,
+            'statements': self.statements,
+            'db_ms': round(self.db_ms, 3),
+            'total_ms': round(self.total_ms, 3),
+            'rows': self.rows,
+            'slowest': [
+                {'ms': round(ms, 3), 'statement': statement}
+                for ms, statement in sorted(self.slowest, reverse=True)
+            ]
+        }
+
+
+class _CountingCursor:
+    """DBAPI cursor proxy that adds the rows fetched through it to a rerun's totals."""
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_current, 'stats', None) is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_current, 'stats', None)
+    starts = conn.info.get('query_start')
+    if stats is None or not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    if cursor.rowcount < 0 and cursor.description is not None and context is not None and not executemany:
+        # The driver can't say how many rows a SELECT returned: count them as the result fetches them
+        context.cursor = _CountingCursor(cursor, stats)
+    stats.record(statement, elapsed_ms, cursor.rowcount)
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute: pop its start here and count it
+    stats = getattr(_current, 'stats', None)
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if not starts or context.statement is None:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    if stats is not None:
+        stats.record(context.statement, elapsed_ms, 0)
+
+
+def install(engine):
+    """Start recording statements run on ``engine``; safe to call more than once."""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+
+@contextmanager
+def track_rerun(page=None):
+    """Attribute the statements run inside the block to one rerun of ``page``.
+
+    The page can be set later through the yielded stats, once it is known.
+    Reruns cut short by st.rerun() or st.stop() are recorded too.
+    """
+    stats = RerunStats(page)
+    _current.stats = stats
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        _current.stats = None
+        stats.total_ms = (time.perf_counter() - start) * 1000
+        record = stats.as_dict()
+        with _history_lock:
+            _history.append(record)
+        if logger.handlers:
+            logger.info(json.dumps(record))
+
+
+def recent_reruns():
+    """The rolling history of rerun records, oldest first."""
+    with _history_lock:
+        return list(_history)
+
+
+def clear_history():
+    with _history_lock:
+        _history.clear()
+
+
+def page_summary(records=None):
+    """Rolling aggregates per page: rerun count, mean and p95 statements and DB time."""
+    records = recent_reruns() if records is None else records
+    columns = ['page', 'reruns', 'statements_mean', 'statements_p95', 'db_ms_mean', 'db_ms_p95',
+               'db_ms_max', 'rows_mean', 'total_ms_mean', 'db_share']
+    if not records:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(records, columns=['page', 'statements', 'db_ms', 'rows', 'total_ms'])
+    df['page'] = df['page'].fillna('Login')
+    grouped = df.groupby('page')
+    summary = pd.DataFrame({
+        'reruns': grouped.size(),
+        'statements_mean': grouped['statements'].mean(),
+        'statements_p95': grouped['statements'].quantile(0.95),
+        'db_ms_mean': grouped['db_ms'].mean(),
+        'db_ms_p95': grouped['db_ms'].quantile(0.95),
+        'db_ms_max': grouped['db_ms'].max(),
+        'rows_mean': grouped['rows'].mean(),
+        'total_ms_mean': grouped['total_ms'].mean()
+    })
+    summary['db_share'] = summary['db_ms_mean'] / summary['total_ms_mean']
+    return summary.reset_index().sort_values('db_ms_mean', ascending=False)[columns].round(3)
+
+
+def slowest_statements(limit=20, records=None):
+    """The slowest statements seen across the history, with the page that ran them."""
+    records = recent_reruns() if records is None else records
+    rows = [
+        {'page': record['page'] or 'Login', 'started_at': record['started_at'], **statement}
+        for record in records
+        for statement in record['slowest']
+    ]
+    if not rows:
+        return pd.DataFrame(columns=['page', 'started_at', 'ms', 'statement'])
+    return pd.DataFrame(rows).nlargest(limit, 'ms').reset_index(drop=True)
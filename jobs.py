@@ -0,0 +1,158 @@
+"""Background jobs for slow reports and exports.
+
+Work submitted here runs on a small bounded thread pool instead of the
+Streamlit script thread, so the page keeps responding while it runs and a
+rerun picks the running job back up instead of starting the work again.
+Threads rather than processes: the heavy lifting is SQL, NumPy and Arrow,
+which release the GIL, and results such as export files stay usable
+without pickling.
+
+Every job has a key built from what it computes. Submitting a key that is
+already queued or running, or that finished less than the TTL ago, returns
+the existing job, so identical requests share one run and one result.
+Failed jobs are not cached; the next submit tries again.
+
+Inside a job, ``set_progress`` reports how far along it is; outside one it
+does nothing, so library code can call it unconditionally.
+
+Environment variables:
+    REPORT_JOB_WORKERS      jobs run at once (default 2)
+    REPORT_JOB_TTL_SECONDS  how long finished results are kept (default 60)
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import track_rerun
+
+JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', '2'))
+JOB_RESULT_TTL = float(os.getenv('REPORT_JOB_TTL_SECONDS', '60'))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_current = threading.local()
+
+
+class Job:
+    """State of one submitted job."""
+
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+        self.status = QUEUED
+        self.progress = None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    def as_dict(self):
+        now = time.monotonic()
+        return {
+            'key': self.key,
+            'label': self.label,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'waited': (self.started_at or now) - self.submitted_at,
+            'elapsed': (self.finished_at or now) - self.started_at if self.started_at else 0.0
+        }
+
+
+def set_progress(fraction=None, message=None):
+    """Report progress of the job running on this thread: ``fraction`` in [0, 1] or None if unknown."""
+    job = getattr(_current, 'job', None)
+    if job is not None:
+        job.progress = fraction
+        job.message = message
+
+
+class JobRunner:
+    """Bounded pool of workers with jobs deduplicated and results cached by key."""
+
+    def __init__(self, workers=JOB_WORKERS, ttl=JOB_RESULT_TTL):
+        self.workers = workers
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report-job')
+        return self._executor
+
+    def _expired(self, job, now):
+        return job.status == FAILED or (job.status == DONE and now - job.finished_at > self.ttl)
+
+    def _purge(self, now):
+        # Finished jobs nobody asked for again within the TTL
+        for key in [key for key, job in self._jobs.items() if job.finished_at and now - job.finished_at > self.ttl]:
+            del self._jobs[key]
+
+    def _run(self, job, fn, args, kwargs):
+        job.started_at = time.monotonic()
+        job.status = RUNNING
+        _current.job = job
+        try:
+            # Counted on the Performance page like a page rerun
+            with track_rerun(f"Job: {job.label}"):
+                job.result = fn(*args, **kwargs)
+            job.progress = 1.0
+            # finished_at before status: readers seeing DONE or FAILED rely on it
+            job.finished_at = time.monotonic()
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.finished_at = time.monotonic()
+            job.status = FAILED
+        finally:
+            _current.job = None
+
+    def submit(self, key, fn, *args, label=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` in the background unless job ``key`` is pending or fresh; returns the key."""
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            job = self._jobs.get(key)
+            if job is None or self._expired(job, now):
+                job = self._jobs[key] = Job(key, label or getattr(fn, '__name__', 'job'))
+                self._pool().submit(self._run, job, fn, args, kwargs)
+        return key
+
+    def status(self, key):
+        """The job's state as a dict (status, progress, message, error, timings), or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(key)
+        return job.as_dict() if job else None
+
+    def result(self, key):
+        """The finished job's result; raises LookupError while it is pending and RuntimeError if it failed."""
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None or job.status in (QUEUED, RUNNING):
+            raise LookupError(f"Job {key!r} has not finished")
+        if job.status == FAILED:
+            raise RuntimeError(job.error)
+        return job.result
+
+    def forget(self, key):
+        """Drop a job's cached result, e.g. once its caller has taken ownership of it."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status in (DONE, FAILED):
+                del self._jobs[key]
+
+    def jobs(self):
+        """Every job still known to the runner, oldest first."""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job.submitted_at)
+        return [job.as_dict() for job in jobs]
+
+
+# Shared by every session in the process; the pool starts with the first job
+runner = JobRunner()
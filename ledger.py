@@ -0,0 +1,179 @@
+"""Stock history: the transactions ledger and periodic stock snapshots.
+
+Every stock mutation in utils and sales_import appends a row to
+``transactions`` in the same database transaction. ``stock_snapshots``
+records every phone's stock and price at a point in time, so history
+questions are answered from the nearest snapshot plus a short replay of
+the ledger instead of a scan of all history.
+
+A snapshot is taken whenever the latest one is older than the interval:
+by ``python manage.py migrate`` on every deploy, and in the background
+by ``snapshot_if_due``, which the app calls on every rerun. ``python
+manage.py snapshot`` takes one on demand, e.g. from cron.
+
+Environment variables:
+    STOCK_SNAPSHOT_INTERVAL_HOURS  age of the latest snapshot at which the
+                                   next is taken (default 24)
+"""
+import os
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+from sqlalchemy import func, insert, literal, select, text
+
+from jobs import runner
+from models import Session, Phone, StockSnapshot, Transaction
+
+SNAPSHOT_INTERVAL = timedelta(hours=float(os.getenv('STOCK_SNAPSHOT_INTERVAL_HOURS', '24')))
+
+# Wait before checking again after a background snapshot was submitted, in case it fails
+SNAPSHOT_RETRY_AFTER = timedelta(minutes=15)
+
+# When this process next looks for a due snapshot; set from the latest snapshot's time
+_next_due = datetime.min
+
+
+def take_stock_snapshot():
+    """Record every phone's current stock and price; returns the snapshot time."""
+    session = Session()
+    try:
+        if session.get_bind().dialect.name == 'postgresql':
+            # Wait for in-flight stock writes, so none of them is both missing from the
+            # snapshot and timestamped before it
+            session.execute(text("LOCK TABLE phones IN SHARE MODE"))
+        taken_at = datetime.now()
+        session.execute(
+            insert(StockSnapshot).from_select(
+                ['taken_at', 'phone_model', 'brand', 'price', 'quantity'],
+                select(
+                    literal(taken_at, StockSnapshot.taken_at.type).label('taken_at'),
+                    Phone.model,
+                    Phone.brand,
+                    Phone.price,
+                    Phone.quantity
+                )
+            )
+        )
+        session.commit()
+        return taken_at
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+
+def _latest_snapshot_time(session, when):
+    return session.execute(
+        select(func.max(StockSnapshot.taken_at)).where(StockSnapshot.taken_at <= when)
+    ).scalar()
+
+
+def take_snapshot_if_due(interval=None):
+    """Take a snapshot if the latest is older than ``interval`` (default SNAPSHOT_INTERVAL).
+
+    Returns the new snapshot's time, or None when none was due.
+    """
+    global _next_due
+    interval = SNAPSHOT_INTERVAL if interval is None else interval
+    session = Session()
+    try:
+        latest = _latest_snapshot_time(session, datetime.now())
+    finally:
+        session.close()
+    if latest is not None and datetime.now() - latest < interval:
+        _next_due = latest + interval
+        return None
+    taken_at = take_stock_snapshot()
+    _next_due = taken_at + interval
+    return taken_at
+
+
+def snapshot_if_due():
+    """Take a due snapshot as a background job; only touches the database once one may be due."""
+    global _next_due
+    now = datetime.now()
+    if now < _next_due:
+        return
+    _next_due = now + SNAPSHOT_RETRY_AFTER
+    runner.submit(('stock_snapshot',), take_snapshot_if_due, label="Stock snapshot")
+
+
+def stock_at(phone_model, when):
+    """Stock of ``phone_model`` at ``when``: the nearest earlier snapshot plus the ledger since.
+
+    A model missing from that snapshot had no stock then. Before the
+    first snapshot the whole ledger is replayed from zero.
+    """
+    session = Session()
+    try:
+        snapshot_time = _latest_snapshot_time(session, when)
+        quantity = 0
+        changes = select(func.sum(Transaction.quantity_change)).where(
+            Transaction.phone_model == phone_model,
+            Transaction.timestamp <= when
+        )
+        if snapshot_time is not None:
+            quantity = session.execute(
+                select(StockSnapshot.quantity).where(
+                    StockSnapshot.phone_model == phone_model,
+                    StockSnapshot.taken_at == snapshot_time
+                )
+            ).scalar() or 0
+            changes = changes.where(Transaction.timestamp > snapshot_time)
+        return quantity + (session.execute(changes).scalar() or 0)
+    finally:
+        session.close()
+
+
+def inventory_at(when):
+    """Every model's stock at ``when``, with the price it had at the snapshot.
+
+    Returns a DataFrame of model, brand, price and quantity. Models added
+    since the snapshot take their current price and brand.
+    """
+    session = Session()
+    try:
+        snapshot_time = _latest_snapshot_time(session, when)
+        if snapshot_time is not None:
+            base = pd.DataFrame(
+                session.execute(
+                    select(StockSnapshot.phone_model, StockSnapshot.brand, StockSnapshot.price, StockSnapshot.quantity)
+                    .where(StockSnapshot.taken_at == snapshot_time)
+                ).all(),
+                columns=['model', 'brand', 'price', 'quantity']
+            )
+        else:
+            base = pd.DataFrame(columns=['model', 'brand', 'price', 'quantity'])
+
+        changes = select(Transaction.phone_model, func.sum(Transaction.quantity_change)).where(
+            Transaction.timestamp <= when
+        ).group_by(Transaction.phone_model)
+        if snapshot_time is not None:
+            changes = changes.where(Transaction.timestamp > snapshot_time)
+        changes = pd.DataFrame(session.execute(changes).all(), columns=['model', 'change'])
+
+        # Models that only appear in the replay take their current brand and price
+        new_models = sorted(set(changes['model']) - set(base['model']))
+        if new_models:
+            current = pd.DataFrame(
+                session.execute(
+                    select(Phone.model, Phone.brand, Phone.price).where(Phone.model.in_(new_models))
+                ).all(),
+                columns=['model', 'brand', 'price']
+            )
+            base = pd.concat([base, current.assign(quantity=0)], ignore_index=True)
+    finally:
+        session.close()
+
+    df = base.merge(changes, on='model', how='outer')
+    df['quantity'] = df['quantity'].fillna(0).astype('int64') + df['change'].fillna(0).astype('int64')
+    df = df.drop(columns='change')
+    return df[df['quantity'] != 0].sort_values('model').reset_index(drop=True)
+
+
+def inventory_value_at(day):
+    """Inventory value at the end of ``day`` (a date or datetime)."""
+    when = datetime.combine(day, time.max) if not isinstance(day, datetime) else day
+    df = inventory_at(when)
+    return float((df['price'].fillna(0) * df['quantity']).sum())
@@ -0,0 +1,118 @@
+"""Maintenance commands for the inventory database.
+
+Usage:
+    python manage.py migrate
+    python manage.py rebuild-rollups
+    python manage.py import-sales FILE [--format csv|jsonl] [--chunk-size N]
+    python manage.py snapshot
+    python manage.py archive [--days N | --before YYYY-MM-DD]
+
+Run ``migrate`` before the app's first start and after every upgrade;
+importing the app never creates or alters tables.
+"""
+import argparse
+
+from sqlalchemy import select
+
+import models
+
+
+def cmd_migrate(args):
+    created = models.migrate()
+    if created:
+        for name in created:
+            print(f"Created {name}")
+    else:
+        print("Schema is up to date")
+    with models.engine.connect() as conn:
+        rollup_empty = conn.execute(select(models.DailySalesRollup.day).limit(1)).first() is None
+        has_sales = conn.execute(select(models.Sale.id).limit(1)).first() is not None
+    if rollup_empty and has_sales:
+        # The rollup table is new, backfill it from the existing sales
+        cmd_rebuild_rollups(args)
+
+    from ledger import take_snapshot_if_due
+
+    # Every deploy runs migrate, so history replays at most a snapshot interval of ledger
+    taken_at = take_snapshot_if_due()
+    if taken_at:
+        print(f"Took stock snapshot at {taken_at:%Y-%m-%d %H:%M:%S}")
+
+
+def cmd_rebuild_rollups(args):
+    import utils
+
+    count = utils.rebuild_sales_rollup()
+    print(f"Rebuilt sales rollup: {count} day/model rows")
+
+
+def cmd_snapshot(args):
+    from ledger import take_stock_snapshot
+
+    taken_at = take_stock_snapshot()
+    print(f"Took stock snapshot at {taken_at:%Y-%m-%d %H:%M:%S}")
+
+
+def cmd_import_sales(args):
+    import time
+
+    from sales_import import import_sales
+
+    start = time.perf_counter()
+    report = import_sales(args.file, fmt=args.format, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Imported {report['imported']} of {report['rows']} rows in {elapsed:.1f}s")
+    for line_number, message in report['errors'][:args.show_errors]:
+        print(f"  line {line_number}: {message}")
+    if len(report['errors']) > args.show_errors:
+        print(f"  ... and {len(report['errors']) - args.show_errors} more errors")
+
+
+def cmd_archive(args):
+    from datetime import date, datetime, time, timedelta
+
+    import archive
+
+    if args.before:
+        before = datetime.combine(date.fromisoformat(args.before), time.min)
+    else:
+        days = archive.ARCHIVE_AFTER_DAYS if args.days is None else args.days
+        before = datetime.combine(date.today() - timedelta(days=days), time.min)
+    report = archive.archive_sales(before)
+    print(f"Archived {report['archived']} sales before {before:%Y-%m-%d} into {len(report['files'])} files")
+    if report['watermark']:
+        print(f"Archive watermark: {report['watermark']:%Y-%m-%d %H:%M:%S}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help="Create missing tables and indexes")
+    migrate_parser.set_defaults(func=cmd_migrate)
+
+    rollup_parser = subparsers.add_parser('rebuild-rollups', help="Recompute the daily sales rollup from raw sales")
+    rollup_parser.set_defaults(func=cmd_rebuild_rollups)
+
+    import_parser = subparsers.add_parser('import-sales', help="Bulk import sales from a CSV or JSONL file")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension")
+    import_parser.add_argument('--chunk-size', type=int, default=5000)
+    import_parser.add_argument('--show-errors', type=int, default=20, help="Row errors to print")
+    import_parser.set_defaults(func=cmd_import_sales)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help="Record every phone's current stock now")
+    snapshot_parser.set_defaults(func=cmd_snapshot)
+
+    archive_parser = subparsers.add_parser('archive', help="Move old sales from the database into Parquet files")
+    archive_parser.add_argument('--days', type=int, default=None,
+                                help="Archive sales older than this many days (default: SALES_ARCHIVE_AFTER_DAYS)")
+    archive_parser.add_argument('--before', help="Archive sales dated before this day instead")
+    archive_parser.set_defaults(func=cmd_archive)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,16 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Enum, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Enum, Boolean, Index, func, inspect, select, text
+from sqlalchemy.orm import declarative_base, sessionmaker
 import os
 from datetime import datetime
 import enum
-from werkzeug.security import generate_password_hash, check_password_hash
+from database import DEFAULT_DATABASE_URL, create_engine_from_env
+from security import hash_password, needs_rehash, verify_password
 
 # Get database URL from environment variable
-DATABASE_URL = os.getenv('DATABASE_URL')
+DATABASE_URL = os.getenv('DATABASE_URL') or DEFAULT_DATABASE_URL
 
-# Create database engine with proper configuration
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    connect_args={'sslmode': 'require'}
-)
+# Create database engine; pool sizing and per-dialect settings come from the environment (see database.py)
+engine = create_engine_from_env(DATABASE_URL)
 
 # Create declarative base
 Base = declarative_base()
@@ -23,6 +19,7 @@ class TransactionType(enum.Enum):
     ADD = "add"
     UPDATE = "update"
     REMOVE = "remove"
+    SALE = "sale"
 
 class PaymentMethod(enum.Enum):
     CASH = "cash"
@@ -42,26 +39,46 @@ class User(Base):
     last_login = Column(DateTime)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
 class Phone(Base):
     __tablename__ = 'phones'
 
     id = Column(Integer, primary_key=True)
-    model = Column(String, nullable=False)
+    model = Column(String, nullable=False, unique=True, index=True)
     brand = Column(String, nullable=False)
     price = Column(Float, nullable=False)
     quantity = Column(Integer, nullable=False)
+    # Stock at or below this is low; server_default lets migrate add it to existing rows
+    reorder_threshold = Column(Integer, nullable=False, default=5, server_default='5')
     last_updated = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+# Units above the reorder threshold; zero or less means low stock
+STOCK_MARGIN = Phone.quantity - Phone.reorder_threshold
+
+# Low-stock lookups range-scan this instead of reading every phone
+Index('ix_phones_stock_margin', STOCK_MARGIN)
+
+# Product search: SQLite range-scans lower() for prefixes, PostgreSQL matches
+# substrings anywhere through pg_trgm
+Index('ix_phones_model_lower', func.lower(Phone.model)).ddl_if(dialect='sqlite')
+Index('ix_phones_brand_lower', func.lower(Phone.brand)).ddl_if(dialect='sqlite')
+Index('ix_phones_model_trgm', Phone.model, postgresql_using='gin',
+      postgresql_ops={'model': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+Index('ix_phones_brand_trgm', Phone.brand, postgresql_using='gin',
+      postgresql_ops={'brand': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+
 class Sale(Base):
     __tablename__ = 'sales'
 
     id = Column(Integer, primary_key=True)
-    phone_model = Column(String, nullable=False)
+    phone_model = Column(String, nullable=False, index=True)
     quantity_sold = Column(Integer, nullable=False)
     unit_price = Column(Float, nullable=False)
     total_amount = Column(Float, nullable=False)
@@ -71,6 +88,44 @@ class Sale(Base):
     sale_date = Column(DateTime, default=datetime.now)
     notes = Column(String)
 
+    # Serves both date-range filters and the (sale_date, id) keyset used for paging
+    __table_args__ = (Index('ix_sales_sale_date_id', 'sale_date', 'id'),)
+
+class DailySalesRollup(Base):
+    __tablename__ = 'sales_daily_rollup'
+
+    # One row per day and model, kept in step with sales by utils.record_sale
+    day = Column(Date, primary_key=True)
+    phone_model = Column(String, primary_key=True)
+    units_sold = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    sale_count = Column(Integer, nullable=False, default=0)
+    cash_count = Column(Integer, nullable=False, default=0)
+    credit_card_count = Column(Integer, nullable=False, default=0)
+    debit_card_count = Column(Integer, nullable=False, default=0)
+    mobile_payment_count = Column(Integer, nullable=False, default=0)
+
+    # Per-model demand over a date window (forecast.py) reads only this index, already grouped by model
+    __table_args__ = (Index('ix_sales_daily_rollup_model_day', 'phone_model', 'day', 'units_sold'),)
+
+# Rollup column counting the sales made with each payment method
+PAYMENT_COUNT_COLUMNS = {
+    PaymentMethod.CASH: 'cash_count',
+    PaymentMethod.CREDIT_CARD: 'credit_card_count',
+    PaymentMethod.DEBIT_CARD: 'debit_card_count',
+    PaymentMethod.MOBILE_PAYMENT: 'mobile_payment_count'
+}
+
+class CacheVersion(Base):
+    __tablename__ = 'cache_versions'
+
+    # Bumped by writes that change data a cache treats as settled, such as sales in closed periods
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Cache version bumped whenever sales history before today can change
+SALES_HISTORY_CACHE = 'sales_history'
+
 class Transaction(Base):
     __tablename__ = 'transactions'
 
@@ -80,11 +135,101 @@ class Transaction(Base):
     quantity_change = Column(Integer, nullable=False)
     previous_quantity = Column(Integer, nullable=False)
     new_quantity = Column(Integer, nullable=False)
-    timestamp = Column(DateTime, default=datetime.now)
+    timestamp = Column(DateTime, default=datetime.now, index=True)
     notes = Column(String)
 
-# Create all tables
-Base.metadata.create_all(engine)
+    # Replaying one model's history from a snapshot seeks on (phone_model, timestamp)
+    __table_args__ = (Index('ix_transactions_phone_model_timestamp', 'phone_model', 'timestamp'),)
+
+class StockSnapshot(Base):
+    __tablename__ = 'stock_snapshots'
+
+    # Every phone's stock and price at taken_at; see ledger.take_stock_snapshot
+    id = Column(Integer, primary_key=True)
+    taken_at = Column(DateTime, nullable=False, index=True)
+    phone_model = Column(String, nullable=False)
+    brand = Column(String, nullable=False)
+    price = Column(Float, nullable=False)
+    quantity = Column(Integer, nullable=False)
 
-# Create session factory
+    __table_args__ = (Index('ix_stock_snapshots_phone_model_taken_at', 'phone_model', 'taken_at'),)
+
+def _add_enum_values(bind):
+    # PostgreSQL enum types don't grow with the Python enum; add members created since the type was
+    if bind.dialect.name != 'postgresql':
+        return
+    with bind.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for enum_class in (TransactionType, PaymentMethod):
+            for member in enum_class:
+                conn.execute(text(f"ALTER TYPE {enum_class.__name__.lower()} ADD VALUE IF NOT EXISTS '{member.name}'"))
+
+def _add_extensions(bind):
+    # The trigram search indexes need pg_trgm before create_all reaches them
+    if bind.dialect.name != 'postgresql':
+        return
+    with bind.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+def _add_missing_columns(bind):
+    # create_all skips tables that already exist, so add columns declared since they were created
+    added = []
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspect(bind).get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            with bind.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f"column {table.name}.{column.name}")
+    return added
+
+def _index_names(bind, table_name):
+    # SQLite reflection skips expression indexes, so read the names from its catalog
+    if bind.dialect.name == 'sqlite':
+        with bind.connect() as conn:
+            return set(conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {'table': table_name}
+            ).scalars())
+    return {index['name'] for index in inspect(bind).get_indexes(table_name)}
+
+def migrate(bind=engine):
+    """Bring an existing database up to the current schema.
+
+    Creates missing tables, then any declared column or index that is
+    missing on an existing table. Returns descriptions of what was added.
+    """
+    _add_extensions(bind)
+    existing_tables = set(inspect(bind).get_table_names())
+    Base.metadata.create_all(bind)
+    created = [f"table {table.name}" for table in Base.metadata.sorted_tables if table.name not in existing_tables]
+    _add_enum_values(bind)
+    created += _add_missing_columns(bind)
+
+    with bind.begin() as conn:
+        duplicates = conn.execute(
+            select(Phone.model).group_by(Phone.model).having(func.count(Phone.id) > 1)
+        ).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            "Cannot add the unique index on phones.model, these models appear more than once: "
+            + ", ".join(duplicates)
+        )
+
+    for table in Base.metadata.sorted_tables:
+        existing = _index_names(bind, table.name)
+        missing = [index for index in table.indexes if index.name not in existing]
+        for index in missing:
+            # Skipped by create() when declared for another dialect
+            index.create(bind)
+        if missing:
+            created.extend(f"index {name}" for name in sorted(_index_names(bind, table.name) - existing))
+    return created
+
+# Create session factory; tables are created by `python manage.py migrate`, not on import
 Session = sessionmaker(bind=engine)
\ No newline at end of file
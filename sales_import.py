@@ -0,0 +1,224 @@
+"""Bulk import of sales keyed from other terminals.
+
+Files are streamed in chunks, so memory stays flat however large the
+file is. Each chunk is validated row by row, each model's stock is taken
+with one relative conditional UPDATE for the chunk's total, and its sales
+are inserted with executemany. Bad rows are reported and skipped; they
+never abort the rest of the import.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from models import Session, Phone, Sale, TransactionType, SALES_HISTORY_CACHE
+from utils import (
+    WRITE_CHUNK_SIZE,
+    _apply_sales_to_rollup,
+    _chunks,
+    _decrement_stock,
+    _ledger_entry,
+    _record_transactions,
+    bump_cache_version,
+    invalidate_inventory_cache,
+    parse_payment_method,
+    validate_sale_input
+)
+
+# Rows validated and written per transaction
+IMPORT_CHUNK_SIZE = 5000
+
+# Columns a row must have; customer_name, customer_phone, sale_date and notes are optional
+REQUIRED_COLUMNS = ['phone_model', 'quantity_sold', 'unit_price', 'payment_method']
+
+# Times a model's rows are re-allocated after concurrent sales beat the import to its stock
+STOCK_RETRIES = 3
+
+
+def _open_text(source):
+    if isinstance(source, str):
+        return open(source, newline='', encoding='utf-8-sig')
+    if isinstance(source, io.TextIOBase):
+        return source
+    # Binary uploads, e.g. Streamlit's UploadedFile
+    return io.TextIOWrapper(source, newline='', encoding='utf-8-sig')
+
+
+def _detect_format(source, fmt):
+    if fmt:
+        return fmt
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    return 'jsonl' if name.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def _read_rows(stream, fmt):
+    """Yield ``(line_number, row_dict_or_None, error)`` for every record in the file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "Each line must be a JSON object"
+                continue
+            yield line_number, row, None
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _parse_row(row):
+    """Turn a raw record into a sale dict, or return the reason it was rejected."""
+    if 'phone_model' not in row and 'model' in row:
+        row = dict(row, phone_model=row['model'])
+    missing = [column for column in REQUIRED_COLUMNS if row.get(column) in (None, '')]
+    if missing:
+        return None, "Missing " + ", ".join(missing)
+
+    phone_model = str(row['phone_model']).strip()
+    valid, message = validate_sale_input(phone_model, row['quantity_sold'], row['unit_price'], row['payment_method'])
+    if not valid:
+        return None, message
+
+    sale_date = row.get('sale_date')
+    if sale_date in (None, ''):
+        sale_date = datetime.now()
+    else:
+        try:
+            sale_date = datetime.fromisoformat(str(sale_date))
+        except ValueError:
+            return None, f"Invalid sale_date: {sale_date}"
+
+    quantity = int(row['quantity_sold'])
+    unit_price = float(row['unit_price'])
+    return {
+        'phone_model': phone_model,
+        'quantity_sold': quantity,
+        'unit_price': unit_price,
+        'total_amount': quantity * unit_price,
+        'payment_method': parse_payment_method(row['payment_method']),
+        'customer_name': row.get('customer_name') or None,
+        'customer_phone': row.get('customer_phone') or None,
+        'sale_date': sale_date,
+        'notes': row.get('notes') or None
+    }, None
+
+
+def _take_stock(session, model, rows, available, now, errors):
+    """Decrement ``model`` for as many of its ``(line_number, sale)`` rows as stock covers, in file order.
+
+    ``available`` is the stock last read, or None if the model was not
+    found. Returns the accepted rows and the new stock; rejected rows go
+    to ``errors``.
+    """
+    for _ in range(STOCK_RETRIES):
+        if available is None:
+            errors.extend((line_number, "Phone model not found in inventory") for line_number, sale in rows)
+            return [], None
+        taken, rejected, left = [], [], available
+        for line_number, sale in rows:
+            if sale['quantity_sold'] <= left:
+                left -= sale['quantity_sold']
+                taken.append((line_number, sale))
+            else:
+                rejected.append(line_number)
+        if not taken:
+            break
+        new_quantity = _decrement_stock(session, model, available - left, now)
+        if new_quantity is not None:
+            errors.extend((line_number, "Insufficient stock") for line_number in rejected)
+            return taken, new_quantity
+        # Sold elsewhere since the read: re-check what is left and allocate again
+        available = session.execute(select(Phone.quantity).where(Phone.model == model)).scalar()
+    errors.extend((line_number, "Insufficient stock") for line_number, sale in rows)
+    return [], None
+
+
+def _import_chunk(chunk, errors):
+    """Write one chunk of ``(line_number, sale)`` pairs in a single transaction."""
+    # Rejections count only once the chunk commits; a failed chunk reports just the failure
+    rejected = []
+    session = Session()
+    try:
+        rows = {}
+        for line_number, sale in chunk:
+            rows.setdefault(sale['phone_model'], []).append((line_number, sale))
+        # Only a first guess: the conditional UPDATE in _take_stock has the final say
+        stock = dict(session.execute(select(Phone.model, Phone.quantity).where(Phone.model.in_(rows))).all())
+
+        now = datetime.now()
+        accepted, ledger = [], []
+        # One relative decrement per model for the whole chunk, in model order so
+        # concurrent imports and cart sales take the row locks in the same order
+        for model in sorted(rows):
+            taken, new_quantity = _take_stock(session, model, rows[model], stock.get(model), now, rejected)
+            if taken:
+                accepted.extend(taken)
+                total = sum(sale['quantity_sold'] for _, sale in taken)
+                ledger.append(_ledger_entry(model, TransactionType.SALE, new_quantity + total, new_quantity, now, "Bulk import"))
+        if not accepted:
+            session.rollback()
+            errors.extend(rejected)
+            return 0
+
+        # Back in file order, so sale ids follow the file as before
+        accepted = [sale for _, sale in sorted(accepted, key=lambda pair: pair[0])]
+        for batch in _chunks(accepted, WRITE_CHUNK_SIZE):
+            session.execute(insert(Sale), batch)
+        _apply_sales_to_rollup(session, accepted)
+        # Imported sales can be dated in periods the analytics cache treats as closed
+        bump_cache_version(session, SALES_HISTORY_CACHE)
+        _record_transactions(session, ledger)
+
+        session.commit()
+        errors.extend(rejected)
+        return len(accepted)
+    except Exception as e:
+        session.rollback()
+        errors.extend((line_number, f"Chunk failed: {e}") for line_number, _ in chunk)
+        return 0
+    finally:
+        session.close()
+
+
+def import_sales(source, fmt=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import sales from a CSV or JSONL file path or file object.
+
+    Returns a dict with the number of ``rows`` read, the number
+    ``imported`` and a list of ``(line_number, message)`` ``errors``.
+    """
+    fmt = _detect_format(source, fmt)
+    stream = _open_text(source)
+    report = {'rows': 0, 'imported': 0, 'errors': []}
+    try:
+        chunk = []
+        for line_number, row, error in _read_rows(stream, fmt):
+            report['rows'] += 1
+            if row is not None:
+                sale, error = _parse_row(row)
+            if error:
+                report['errors'].append((line_number, error))
+                continue
+            chunk.append((line_number, sale))
+            if len(chunk) >= chunk_size:
+                report['imported'] += _import_chunk(chunk, report['errors'])
+                chunk = []
+        if chunk:
+            report['imported'] += _import_chunk(chunk, report['errors'])
+    finally:
+        if isinstance(source, str):
+            stream.close()
+        if report['imported']:
+            invalidate_inventory_cache()
+
+    report['errors'].sort()
+    return report
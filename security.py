@@ -0,0 +1,68 @@
+"""Password hashing on a bounded worker pool.
+
+Hashing is deliberately slow, so it runs on a small pool of worker
+threads (the hash functions release the GIL) instead of inline. A burst of
+logins at shift start then queues for the pool instead of every script
+thread hashing at once and stalling everyone else's reruns.
+
+Environment variables:
+    PASSWORD_HASH_METHOD   werkzeug method and cost for new hashes, e.g.
+                           scrypt:32768:8:1 or pbkdf2:sha256:600000
+                           (default scrypt)
+    PASSWORD_HASH_WORKERS  hashes computed at once (default: CPU count)
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 0)) or os.cpu_count() or 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+        return _executor
+
+
+def configure(method=None, workers=None):
+    """Change the hash method or pool size, e.g. from a benchmark."""
+    global HASH_METHOD, HASH_WORKERS, _executor
+    with _executor_lock:
+        if method:
+            HASH_METHOD = method
+        if workers:
+            HASH_WORKERS = workers
+            if _executor is not None:
+                _executor.shutdown(wait=True)
+                _executor = None
+
+
+def hash_password(password):
+    """Hash ``password`` with HASH_METHOD on the worker pool."""
+    return _pool().submit(generate_password_hash, password, HASH_METHOD).result()
+
+
+def verify_password(password_hash, password):
+    """Check ``password`` against a stored hash on the worker pool."""
+    return _pool().submit(check_password_hash, password_hash, password).result()
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1"),
+    # so ask it for the prefix it writes instead of parsing the method string
+    return _pool().submit(generate_password_hash, '', method).result().split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """True when ``password_hash`` was made with a method or cost other than HASH_METHOD."""
+    return password_hash.split('$', 1)[0] != _method_prefix(HASH_METHOD)
@@ -1,55 +1,393 @@
+import importlib
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 from datetime import datetime
-import streamlit as st
-from models import Session, Phone, Sale
-from sqlalchemy import func
+import archive
+from models import Session, Phone, Sale, Transaction, TransactionType, DailySalesRollup, PaymentMethod, PAYMENT_COUNT_COLUMNS, STOCK_MARGIN, CacheVersion, SALES_HISTORY_CACHE
+from sqlalchemy import func, select, insert, update, delete, case, text, and_, or_, type_coerce, String
+
+# Rollup columns that accumulate when sales are added
+ROLLUP_COUNTERS = ['units_sold', 'revenue', 'sale_count'] + list(PAYMENT_COUNT_COLUMNS.values())
+
+# Columns and dtypes of the frames returned by load_inventory
+INVENTORY_DTYPES = {
+    'model': 'object',
+    'brand': 'category',
+    'price': 'float64',
+    'quantity': 'int64',
+    'reorder_threshold': 'int64',
+    'last_updated': 'datetime64'
+}
+
+# Columns and dtypes of the sales frames returned by get_sales_data and get_sales_page
+SALES_DTYPES = {
+    'sale_date': 'datetime64',
+    'phone_model': 'object',
+    'quantity_sold': 'int64',
+    'unit_price': 'float64',
+    'total_amount': 'float64',
+    'payment_method': 'payment_method',
+    'customer_name': 'object',
+    'customer_phone': 'object'
+}
+
+# Rows fetched per round trip when streaming query results into a frame
+LOAD_BATCH_SIZE = 50000
+
+# Rows per statement for batched inventory writes
+WRITE_CHUNK_SIZE = 1000
+
+# Seconds a cached inventory snapshot is served before probing the DB for changes
+INVENTORY_PROBE_INTERVAL = float(os.getenv('INVENTORY_CACHE_PROBE_SECONDS', '2'))
+
+_inventory_lock = threading.Lock()
+_inventory_load_lock = threading.Lock()
+_inventory_cache = {
+    'version': 0,
+    'df': None,
+    'stamp': None,
+    'checked_at': 0.0
+}
+
+def _frame_from_batches(partitions, dtypes):
+    """Build a DataFrame from batches of row tuples, one batch of columns at a time.
+
+    ``partitions`` is typically ``result.partitions()`` of a streamed
+    select; ``dtypes`` maps each selected column, in select order, to its
+    frame dtype. ``payment_method`` columns are read as enum names and turned
+    into a categorical of the enum values.
+    """
+    columns = list(dtypes)
+    batches = {column: [] for column in columns}
+    for partition in partitions:
+        for column, values in zip(columns, zip(*partition)):
+            dtype = dtypes[column]
+            if dtype in ('float64', 'int64'):
+                batches[column].append(np.array(values, dtype=dtype))
+            elif dtype == 'datetime64':
+                batches[column].append(np.array(values, dtype='datetime64[us]'))
+            else:
+                batches[column].append(np.array(values, dtype=object))
+
+    data = {}
+    for column in columns:
+        dtype = dtypes[column]
+        if batches[column]:
+            values = np.concatenate(batches[column])
+        else:
+            values = np.array([], dtype='datetime64[us]' if dtype == 'datetime64' else dtype if dtype in ('float64', 'int64') else object)
+        if dtype == 'category':
+            values = pd.Categorical(values)
+        elif dtype == 'payment_method':
+            values = pd.Categorical(values, categories=[method.name for method in PaymentMethod]).rename_categories(
+                [method.value for method in PaymentMethod]
+            )
+        data[column] = values
+    return pd.DataFrame(data, columns=columns)
+
+def _projected_columns(session, entity, dtypes):
+    columns = []
+    raw_timestamps = session.get_bind().dialect.name == 'sqlite'
+    for name, dtype in dtypes.items():
+        column = getattr(entity, name)
+        # payment_method is read as the stored enum name so the frame can map it without per-row enum lookups;
+        # SQLite timestamps are ISO text that numpy parses a whole batch at a time
+        if dtype == 'payment_method' or (dtype == 'datetime64' and raw_timestamps):
+            column = type_coerce(column, String).label(name)
+        columns.append(column)
+    return columns
+
+def _stream(session, query):
+    # Core execution skips the ORM result layer; yield_per streams from a server-side cursor where supported
+    return session.connection().execute(query.execution_options(yield_per=LOAD_BATCH_SIZE))
+
+def _read_inventory(session):
+    # Select just the frame's columns and build it from the cursor, skipping ORM objects
+    result = _stream(session, select(*_projected_columns(session, Phone, INVENTORY_DTYPES)))
+    return _frame_from_batches(result.partitions(), INVENTORY_DTYPES)
+
+def _inventory_stamp(session):
+    # Cheap change probe: any insert or update moves max(last_updated), any delete moves the count
+    return tuple(session.execute(
+        select(func.max(Phone.last_updated), func.count(Phone.id))
+    ).one())
+
+def inventory_version():
+    """Return the version of the shared inventory snapshot.
+
+    The version goes up whenever this process writes inventory or sales,
+    or when a probe notices that another process changed the phones table.
+    """
+    return _inventory_cache['version']
+
+def invalidate_inventory_cache():
+    with _inventory_lock:
+        _inventory_cache['version'] += 1
+        _inventory_cache['df'] = None
+        _inventory_cache['stamp'] = None
 
 def load_inventory():
+    """Return the current inventory, served from a process-wide snapshot.
+
+    Every Streamlit session shares one snapshot. Writes through this module
+    invalidate it directly; changes made by other processes are picked up
+    by a ``max(last_updated)``/``count`` probe run at most once every
+    ``INVENTORY_CACHE_PROBE_SECONDS``.
+    """
+    with _inventory_lock:
+        cached = _inventory_cache['df']
+        if cached is not None and time.monotonic() - _inventory_cache['checked_at'] < INVENTORY_PROBE_INTERVAL:
+            return cached.copy()
+
+    # Only one session reloads at a time; the others reuse its result
+    with _inventory_load_lock:
+        with _inventory_lock:
+            version = _inventory_cache['version']
+            cached = _inventory_cache['df']
+            stamp = _inventory_cache['stamp']
+            if cached is not None and time.monotonic() - _inventory_cache['checked_at'] < INVENTORY_PROBE_INTERVAL:
+                return cached.copy()
+
+        session = Session()
+        try:
+            current_stamp = _inventory_stamp(session)
+            if cached is not None and current_stamp == stamp:
+                with _inventory_lock:
+                    _inventory_cache['checked_at'] = time.monotonic()
+                return cached.copy()
+            df = _read_inventory(session)
+        finally:
+            session.close()
+
+        with _inventory_lock:
+            # A local write during the reload makes this result stale; serve it once but don't keep it
+            if _inventory_cache['version'] == version:
+                if cached is not None:
+                    _inventory_cache['version'] += 1
+                _inventory_cache['df'] = df
+                _inventory_cache['stamp'] = current_stamp
+                _inventory_cache['checked_at'] = time.monotonic()
+        return df.copy()
+
+def _phone_records(df):
+    # reorder_threshold is only written when the frame has the column
+    columns = ['model', 'brand', 'price', 'quantity']
+    if 'reorder_threshold' in df.columns:
+        columns.append('reorder_threshold')
+    # Last occurrence wins when the frame carries the same model twice
+    records = {}
+    for values in df[columns].itertuples(index=False):
+        record = dict(zip(columns, values))
+        record['price'] = float(record['price'])
+        record['quantity'] = int(record['quantity'])
+        if 'reorder_threshold' in record:
+            # Blank thresholds are filled in by _upsert_phones
+            record['reorder_threshold'] = None if pd.isna(record['reorder_threshold']) else int(record['reorder_threshold'])
+        records[record['model']] = record
+    return records
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _ledger_entry(phone_model, transaction_type, previous_quantity, new_quantity, timestamp, notes=None):
+    return {
+        'phone_model': phone_model,
+        'transaction_type': transaction_type,
+        'quantity_change': new_quantity - previous_quantity,
+        'previous_quantity': previous_quantity,
+        'new_quantity': new_quantity,
+        'timestamp': timestamp,
+        'notes': notes
+    }
+
+def _record_transactions(session, entries):
+    """Append stock movements to the transactions ledger inside the caller's transaction."""
+    for chunk in _chunks(entries, WRITE_CHUNK_SIZE):
+        session.execute(insert(Transaction), chunk)
+
+def _upsert_phones(session, records, existing=None, chunk_size=WRITE_CHUNK_SIZE):
+    """Insert new models and update changed ones; unchanged rows are not touched."""
+    inserts, updates, ledger = [], [], []
+    rebranded = False
+    now = datetime.now()
+    for chunk in _chunks(records.values(), chunk_size):
+        if existing is None:
+            rows = session.execute(
+                select(Phone.id, Phone.model, Phone.brand, Phone.price, Phone.quantity, Phone.reorder_threshold)
+                .where(Phone.model.in_([record['model'] for record in chunk]))
+            )
+            current = {row.model: row for row in rows}
+        else:
+            current = existing
+        for record in chunk:
+            row = current.get(record['model'])
+            if 'reorder_threshold' in record and record['reorder_threshold'] is None:
+                # Keep the current threshold, or give a new model the column default
+                threshold = row.reorder_threshold if row is not None else Phone.__table__.c.reorder_threshold.default.arg
+                record = dict(record, reorder_threshold=threshold)
+            if row is None:
+                inserts.append(dict(record, last_updated=now))
+                ledger.append(_ledger_entry(record['model'], TransactionType.ADD, 0, record['quantity'], now))
+            elif any(getattr(row, field) != value for field, value in record.items()):
+                updates.append(dict(record, id=row.id, last_updated=now))
+                rebranded = rebranded or row.brand != record['brand']
+                if row.quantity != record['quantity']:
+                    ledger.append(_ledger_entry(record['model'], TransactionType.UPDATE, row.quantity, record['quantity'], now))
+
+    for chunk in _chunks(inserts, chunk_size):
+        session.execute(insert(Phone), chunk)
+    for chunk in _chunks(updates, chunk_size):
+        session.execute(update(Phone), chunk)
+    _record_transactions(session, ledger)
+    if rebranded:
+        # Past sales are grouped by the model's current brand, so closed brand buckets move
+        bump_cache_version(session, SALES_HISTORY_CACHE)
+    return len(inserts), len(updates)
+
+def save_inventory(df):
+    """Make the phones table match ``df``, writing only the rows that differ."""
     session = Session()
     try:
-        # Query all phones and convert to DataFrame
-        phones = session.query(Phone).all()
-        if phones:
-            data = [{
-                'model': phone.model,
-                'brand': phone.brand,
-                'price': phone.price,
-                'quantity': phone.quantity,
-                'last_updated': phone.last_updated
-            } for phone in phones]
-            return pd.DataFrame(data)
-        else:
-            return pd.DataFrame({
-                'model': [],
-                'brand': [],
-                'price': [],
-                'quantity': [],
-                'last_updated': []
-            })
+        records = _phone_records(df)
+        existing = {
+            row.model: row for row in session.execute(
+                select(Phone.id, Phone.model, Phone.brand, Phone.price, Phone.quantity, Phone.reorder_threshold)
+            )
+        }
+        _upsert_phones(session, records, existing=existing)
+
+        removed = [model for model in existing if model not in records]
+        for chunk in _chunks(removed, WRITE_CHUNK_SIZE):
+            session.execute(delete(Phone).where(Phone.model.in_(chunk)))
+        now = datetime.now()
+        _record_transactions(session, [
+            _ledger_entry(model, TransactionType.REMOVE, existing[model].quantity, 0, now)
+            for model in removed
+        ])
+        if removed:
+            # Their past sales no longer group under their brands
+            bump_cache_version(session, SALES_HISTORY_CACHE)
+
+        session.commit()
+        invalidate_inventory_cache()
+    except Exception as e:
+        session.rollback()
+        raise e
     finally:
         session.close()
 
-def save_inventory(df):
+def upsert_inventory(df, chunk_size=WRITE_CHUNK_SIZE):
+    """Bulk insert-or-update the phones in ``df`` keyed by model.
+
+    Models that are not in ``df`` are left alone. Returns the number of
+    inserted and updated rows.
+    """
     session = Session()
     try:
-        # Clear existing records
-        session.query(Phone).delete()
+        counts = _upsert_phones(session, _phone_records(df), chunk_size=chunk_size)
+        session.commit()
+        invalidate_inventory_cache()
+        return counts
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
 
-        # Add new records
-        for _, row in df.iterrows():
-            phone = Phone(
-                model=row['model'],
-                brand=row['brand'],
-                price=row['price'],
-                quantity=row['quantity'],
-                last_updated=datetime.now()
-            )
-            session.add(phone)
+def add_phone(model, brand, price, quantity, reorder_threshold=None):
+    session = Session()
+    try:
+        if session.execute(select(Phone.id).where(Phone.model == model)).first():
+            return False, f"{model} is already in inventory"
+        now = datetime.now()
+        session.add(Phone(
+            model=model,
+            brand=brand,
+            price=float(price),
+            quantity=int(quantity),
+            reorder_threshold=None if reorder_threshold is None else int(reorder_threshold),
+            last_updated=now
+        ))
+        _record_transactions(session, [_ledger_entry(model, TransactionType.ADD, 0, int(quantity), now)])
+        session.commit()
+        invalidate_inventory_cache()
+        return True, "Item added successfully!"
+    except Exception as e:
+        session.rollback()
+        return False, str(e)
+    finally:
+        session.close()
+
+def update_phone(model, brand=None, price=None, quantity=None, reorder_threshold=None):
+    changes = {}
+    if brand is not None:
+        changes['brand'] = brand
+    if price is not None:
+        changes['price'] = float(price)
+    if quantity is not None:
+        changes['quantity'] = int(quantity)
+    if reorder_threshold is not None:
+        changes['reorder_threshold'] = int(reorder_threshold)
+    if not changes:
+        return False, "Nothing to update"
 
+    session = Session()
+    try:
+        row = session.execute(
+            select(Phone.id, Phone.brand, Phone.quantity).where(Phone.model == model).with_for_update()
+        ).first()
+        if row is None:
+            session.rollback()
+            return False, "Phone model not found in inventory"
+        now = datetime.now()
+        session.execute(
+            update(Phone)
+            .where(Phone.id == row.id)
+            .values(last_updated=now, **changes)
+            .execution_options(synchronize_session=False)
+        )
+        if 'quantity' in changes and changes['quantity'] != row.quantity:
+            _record_transactions(session, [
+                _ledger_entry(model, TransactionType.UPDATE, row.quantity, changes['quantity'], now)
+            ])
+        if changes.get('brand', row.brand) != row.brand:
+            # Past sales are grouped by the model's current brand, so closed brand buckets move
+            bump_cache_version(session, SALES_HISTORY_CACHE)
         session.commit()
+        invalidate_inventory_cache()
+        return True, "Stock updated successfully!"
     except Exception as e:
         session.rollback()
-        raise e
+        return False, str(e)
+    finally:
+        session.close()
+
+def remove_phone(model):
+    session = Session()
+    try:
+        row = session.execute(
+            select(Phone.id, Phone.quantity).where(Phone.model == model).with_for_update()
+        ).first()
+        if row is None:
+            session.rollback()
+            return False, "Phone model not found in inventory"
+        session.execute(delete(Phone).where(Phone.id == row.id))
+        _record_transactions(session, [
+            _ledger_entry(model, TransactionType.REMOVE, row.quantity, 0, datetime.now())
+        ])
+        # The model's past sales no longer group under its brand
+        bump_cache_version(session, SALES_HISTORY_CACHE)
+        session.commit()
+        invalidate_inventory_cache()
+        return True, "Item removed successfully!"
+    except Exception as e:
+        session.rollback()
+        return False, str(e)
     finally:
         session.close()
 
@@ -72,41 +410,293 @@ def validate_input(model, brand, price, quantity):
 
     return True, ""
 
+def parse_payment_method(value):
+    """Accept a PaymentMethod, its value (``"cash"``) or its name (``"CASH"``)."""
+    if isinstance(value, PaymentMethod):
+        return value
+    try:
+        return PaymentMethod(value)
+    except ValueError:
+        return PaymentMethod[str(value).strip().upper()]
+
+def validate_sale_input(phone_model, quantity, unit_price, payment_method):
+    if not phone_model:
+        return False, "Model cannot be empty"
+    try:
+        unit_price = float(unit_price)
+        if unit_price <= 0:
+            return False, "Price must be greater than 0"
+    except (TypeError, ValueError):
+        return False, "Price must be a valid number"
+
+    try:
+        quantity = int(quantity)
+        if quantity < 1:
+            return False, "Quantity must be at least 1"
+    except (TypeError, ValueError):
+        return False, "Quantity must be a valid integer"
+
+    try:
+        parse_payment_method(payment_method)
+    except KeyError:
+        return False, f"Unknown payment method: {payment_method}"
+
+    return True, ""
+
 def calculate_total_value(df):
     return (df['price'] * df['quantity']).sum()
 
 def get_low_stock_items(df, threshold=5):
     return df[df['quantity'] <= threshold]
 
+def get_dashboard_metrics():
+    """Inventory and sales totals for the dashboard, aggregated in one query.
+
+    Returns total_products, total_stock, inventory_value, low_stock_count,
+    total_sales and total_units_sold.
+    """
+    low_stock_count = select(func.count()).select_from(Phone).where(STOCK_MARGIN <= 0).scalar_subquery()
+    total_sales = select(func.coalesce(func.sum(DailySalesRollup.revenue), 0)).scalar_subquery()
+    total_units_sold = select(func.coalesce(func.sum(DailySalesRollup.units_sold), 0)).scalar_subquery()
+    session = Session()
+    try:
+        row = session.execute(select(
+            func.count(Phone.id).label('total_products'),
+            func.coalesce(func.sum(Phone.quantity), 0).label('total_stock'),
+            func.coalesce(func.sum(Phone.price * Phone.quantity), 0).label('inventory_value'),
+            low_stock_count.label('low_stock_count'),
+            total_sales.label('total_sales'),
+            total_units_sold.label('total_units_sold')
+        )).one()
+        return row._asdict()
+    finally:
+        session.close()
+
+def get_low_stock_phones(limit=None):
+    """Phones at or below their reorder threshold, furthest below first.
+
+    Served by the index on quantity - reorder_threshold, so the cost
+    follows the number of low-stock phones rather than the catalogue size.
+    """
+    query = (
+        select(Phone.model, Phone.brand, Phone.quantity, Phone.reorder_threshold)
+        .where(STOCK_MARGIN <= 0)
+        .order_by(STOCK_MARGIN, Phone.model)
+        .limit(limit)
+    )
+    session = Session()
+    try:
+        return pd.DataFrame(
+            session.execute(query).all(),
+            columns=['model', 'brand', 'quantity', 'reorder_threshold']
+        )
+    finally:
+        session.close()
+
+def _prefix_range(column, prefix):
+    # lower(column) starts with prefix, as a range the lower() index can scan
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(func.lower(column) >= prefix, func.lower(column) < upper)
+
+def search_products(query, limit=20):
+    """Up to ``limit`` phones matching ``query``, with their stock and price.
+
+    Matches are case-insensitive: model or brand prefixes on SQLite, and
+    substrings anywhere on PostgreSQL, both served by the search indexes.
+    An exact model comes first, then model matches, then brand matches.
+    An empty query lists the first phones by model. Returns a list of
+    dicts with model, brand, price, quantity and reorder_threshold.
+    """
+    term = (query or '').strip().lower()
+    select_phones = select(Phone.model, Phone.brand, Phone.price, Phone.quantity, Phone.reorder_threshold)
+    session = Session()
+    try:
+        if not term:
+            rows = session.execute(select_phones.order_by(Phone.model).limit(limit)).all()
+            return [row._asdict() for row in rows]
+        if session.get_bind().dialect.name == 'postgresql':
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            model_hit = Phone.model.ilike(pattern, escape='\\')
+            brand_hit = Phone.brand.ilike(pattern, escape='\\')
+        else:
+            model_hit = _prefix_range(Phone.model, term)
+            brand_hit = _prefix_range(Phone.brand, term)
+        rank = case((func.lower(Phone.model) == term, 0), (model_hit, 1), else_=2)
+        rows = session.execute(
+            select_phones.where(or_(model_hit, brand_hit)).order_by(rank, Phone.model).limit(limit)
+        ).all()
+        return [row._asdict() for row in rows]
+    finally:
+        session.close()
+
+def get_phone(model):
+    """The phone with exactly this model as a dict like search_products returns, or None."""
+    session = Session()
+    try:
+        row = session.execute(
+            select(Phone.model, Phone.brand, Phone.price, Phone.quantity, Phone.reorder_threshold)
+            .where(Phone.model == model)
+        ).first()
+        return row._asdict() if row else None
+    finally:
+        session.close()
+
+def _rollup_rows(sales):
+    """Fold sale dicts into per (day, model) increments for sales_daily_rollup."""
+    rows = {}
+    for sale in sales:
+        key = (sale['sale_date'].date(), sale['phone_model'])
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = dict({counter: 0 for counter in ROLLUP_COUNTERS}, day=key[0], phone_model=key[1])
+        row['units_sold'] += sale['quantity_sold']
+        row['revenue'] += sale['total_amount']
+        row['sale_count'] += 1
+        row[PAYMENT_COUNT_COLUMNS[PaymentMethod(sale['payment_method'])]] += 1
+    # Sorted so concurrent writers always lock rollup rows in the same order
+    return [rows[key] for key in sorted(rows)]
+
+def _apply_sales_to_rollup(session, sales):
+    """Add ``sales`` to the daily rollup inside the caller's transaction."""
+    _add_rollup_rows(session, _rollup_rows(sales))
+
+def _add_rollup_rows(session, rows):
+    # Adds each row's counters to the rollup row of the same day and model, creating it if needed
+    if not rows:
+        return
+
+    table = DailySalesRollup.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # Only the dialect in use is imported; the engine has already loaded it
+        upsert = importlib.import_module(f'sqlalchemy.dialects.{dialect}').insert(table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=['day', 'phone_model'],
+            set_={counter: table.c[counter] + upsert.excluded[counter] for counter in ROLLUP_COUNTERS}
+        )
+        for chunk in _chunks(rows, WRITE_CHUNK_SIZE):
+            session.execute(upsert, chunk)
+        return
+
+    for row in rows:
+        result = session.execute(
+            update(table)
+            .where(table.c.day == row['day'], table.c.phone_model == row['phone_model'])
+            .values({counter: table.c[counter] + row[counter] for counter in ROLLUP_COUNTERS})
+        )
+        if result.rowcount == 0:
+            session.execute(insert(table), row)
+
+def bump_cache_version(session, name):
+    """Move cache ``name`` to a new version inside the caller's transaction."""
+    table = CacheVersion.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        upsert = importlib.import_module(f'sqlalchemy.dialects.{dialect}').insert(table).values(name=name, version=1)
+        session.execute(upsert.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'version': table.c.version + 1}
+        ))
+    elif not session.execute(
+        update(table).where(table.c.name == name).values(version=table.c.version + 1)
+    ).rowcount:
+        session.execute(insert(table).values(name=name, version=1))
+
+def cache_version(name):
+    session = Session()
+    try:
+        return session.execute(select(CacheVersion.version).where(CacheVersion.name == name)).scalar() or 0
+    finally:
+        session.close()
+
+def rebuild_sales_rollup():
+    """Recompute sales_daily_rollup from the raw sales table and the sales archive.
+
+    Returns the number of rollup rows written.
+    """
+    session = Session()
+    try:
+        if session.get_bind().dialect.name == 'postgresql':
+            # Sales recorded during the rebuild wait, then land on top of the fresh rollup
+            session.execute(text("LOCK TABLE sales_daily_rollup IN EXCLUSIVE MODE"))
+        session.execute(delete(DailySalesRollup))
+
+        day = func.date(Sale.sale_date)
+        aggregates = select(
+            day,
+            Sale.phone_model,
+            func.sum(Sale.quantity_sold),
+            func.sum(Sale.total_amount),
+            func.count(Sale.id),
+            *[
+                func.sum(case((Sale.payment_method == method, 1), else_=0))
+                for method in PAYMENT_COUNT_COLUMNS
+            ]
+        ).group_by(day, Sale.phone_model)
+        session.execute(
+            insert(DailySalesRollup).from_select(['day', 'phone_model'] + ROLLUP_COUNTERS, aggregates)
+        )
+        # Archived sales are no longer in the table but still count
+        _add_rollup_rows(session, archive.rollup_rows())
+        count = session.query(func.count()).select_from(DailySalesRollup).scalar()
+        bump_cache_version(session, SALES_HISTORY_CACHE)
+        session.commit()
+        return count
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def _decrement_stock(session, phone_model, quantity, now):
+    """Take ``quantity`` off a model's stock if enough is left; return the new stock or None."""
+    stmt = (
+        update(Phone)
+        .where(Phone.model == phone_model, Phone.quantity >= quantity)
+        .values(quantity=Phone.quantity - quantity, last_updated=now)
+        .execution_options(synchronize_session=False)
+    )
+    if session.get_bind().dialect.update_returning:
+        return session.execute(stmt.returning(Phone.quantity)).scalar()
+    if session.execute(stmt).rowcount == 0:
+        return None
+    # The UPDATE holds the row lock, so this reads our own write
+    return session.execute(select(Phone.quantity).where(Phone.model == phone_model)).scalar()
+
 def record_sale(phone_model, quantity_sold, unit_price, payment_method, customer_name=None, customer_phone=None, notes=None):
     session = Session()
     try:
-        # Check if phone exists and has enough stock
-        phone = session.query(Phone).filter(Phone.model == phone_model).first()
-        if not phone:
-            raise ValueError("Phone model not found in inventory")
-        if phone.quantity < quantity_sold:
+        now = datetime.now()
+
+        # Check and decrement stock in one conditional UPDATE, so concurrent sales of the
+        # same model queue on the row lock instead of reading a stale quantity
+        new_quantity = _decrement_stock(session, phone_model, quantity_sold, now)
+        if new_quantity is None:
+            if session.execute(select(Phone.id).where(Phone.model == phone_model)).first() is None:
+                raise ValueError("Phone model not found in inventory")
             raise ValueError("Insufficient stock")
 
         # Create sale record
         total_amount = quantity_sold * unit_price
-        sale = Sale(
-            phone_model=phone_model,
-            quantity_sold=quantity_sold,
-            unit_price=unit_price,
-            total_amount=total_amount,
-            payment_method=payment_method,
-            customer_name=customer_name,
-            customer_phone=customer_phone,
-            notes=notes
-        )
-        session.add(sale)
-
-        # Update inventory
-        phone.quantity -= quantity_sold
-        phone.last_updated = datetime.now()
+        sale = {
+            'phone_model': phone_model,
+            'quantity_sold': quantity_sold,
+            'unit_price': unit_price,
+            'total_amount': total_amount,
+            'payment_method': payment_method,
+            'customer_name': customer_name,
+            'customer_phone': customer_phone,
+            'sale_date': now,
+            'notes': notes
+        }
+        session.execute(insert(Sale), [sale])
+        _apply_sales_to_rollup(session, [sale])
+        _record_transactions(session, [_ledger_entry(
+            phone_model, TransactionType.SALE, new_quantity + quantity_sold, new_quantity, now, "Sale"
+        )])
 
         session.commit()
+        invalidate_inventory_cache()
         return True, "Sale recorded successfully"
     except Exception as e:
         session.rollback()
@@ -114,57 +704,168 @@ def record_sale(phone_model, quantity_sold, unit_price, payment_method, customer
     finally:
         session.close()
 
-def get_sales_data(start_date=None, end_date=None):
+def record_cart_sale(lines, payment_method, customer_name=None, customer_phone=None, notes=None):
+    """Record every line of a checkout as one atomic sale.
+
+    ``lines`` is a list of ``(phone_model, quantity, unit_price)``. Each
+    model's stock is checked and decremented with a conditional UPDATE, and
+    every ``Sale`` row is inserted, in a single transaction; if any line
+    fails nothing is recorded.
+    """
+    if not lines:
+        return False, "Cart is empty"
+
     session = Session()
     try:
-        query = session.query(Sale)
-        if start_date:
-            query = query.filter(Sale.sale_date >= start_date)
-        if end_date:
-            query = query.filter(Sale.sale_date <= end_date)
+        now = datetime.now()
+        wanted = {}
+        for phone_model, quantity, _ in lines:
+            wanted[phone_model] = wanted.get(phone_model, 0) + quantity
 
-        sales = query.all()
-        if sales:
-            data = [{
-                'sale_date': sale.sale_date,
-                'phone_model': sale.phone_model,
-                'quantity_sold': sale.quantity_sold,
-                'unit_price': sale.unit_price,
-                'total_amount': sale.total_amount,
-                'payment_method': sale.payment_method.value,
-                'customer_name': sale.customer_name,
-                'customer_phone': sale.customer_phone
-            } for sale in sales]
-            return pd.DataFrame(data)
-        else:
-            return pd.DataFrame({
-                'sale_date': [],
-                'phone_model': [],
-                'quantity_sold': [],
-                'unit_price': [],
-                'total_amount': [],
-                'payment_method': [],
-                'customer_name': [],
-                'customer_phone': []
-            })
+        # Decrement in model order so two overlapping carts take the row locks in the same order
+        new_quantities = {}
+        for phone_model, quantity in sorted(wanted.items()):
+            new_quantity = _decrement_stock(session, phone_model, quantity, now)
+            if new_quantity is None:
+                if session.execute(select(Phone.id).where(Phone.model == phone_model)).first() is None:
+                    raise ValueError(f"{phone_model} not found in inventory")
+                raise ValueError(f"Insufficient stock for {phone_model}")
+            new_quantities[phone_model] = new_quantity
+
+        sales = [{
+            'phone_model': phone_model,
+            'quantity_sold': quantity,
+            'unit_price': unit_price,
+            'total_amount': quantity * unit_price,
+            'payment_method': payment_method,
+            'customer_name': customer_name,
+            'customer_phone': customer_phone,
+            'sale_date': now,
+            'notes': notes
+        } for phone_model, quantity, unit_price in lines]
+        session.execute(insert(Sale), sales)
+        _apply_sales_to_rollup(session, sales)
+        _record_transactions(session, [
+            _ledger_entry(
+                phone_model, TransactionType.SALE, new_quantities[phone_model] + quantity,
+                new_quantities[phone_model], now, "Cart sale"
+            )
+            for phone_model, quantity in sorted(wanted.items())
+        ])
+
+        session.commit()
+        invalidate_inventory_cache()
+        return True, f"Sale of {len(lines)} line(s) recorded successfully"
+    except Exception as e:
+        session.rollback()
+        return False, str(e)
     finally:
         session.close()
 
+def _sales_filters(start_date=None, end_date=None, phone_model=None, payment_method=None):
+    # Same day bounds as the archive, so a sale's date decides the same way in both
+    start_date, end_date = archive.date_bounds(start_date, end_date)
+    filters = []
+    if start_date:
+        filters.append(Sale.sale_date >= start_date)
+    if end_date:
+        filters.append(Sale.sale_date <= end_date)
+    if phone_model:
+        filters.append(Sale.phone_model == phone_model)
+    if payment_method:
+        filters.append(Sale.payment_method == PaymentMethod(payment_method))
+    return filters
+
+def get_sales_data(start_date=None, end_date=None, phone_model=None, payment_method=None):
+    """Matching sales from the sales table and, for older dates, the sales archive."""
+    session = Session()
+    try:
+        result = _stream(session, select(*_projected_columns(session, Sale, SALES_DTYPES)).where(
+            *_sales_filters(start_date, end_date, phone_model, payment_method)
+        ))
+        df = _frame_from_batches(result.partitions(), SALES_DTYPES)
+    finally:
+        session.close()
+    archived = archive.read_sales(list(SALES_DTYPES), start_date, end_date, phone_model, payment_method)
+    if archived is not None:
+        df = pd.concat([archived, df], ignore_index=True)
+    return df
+
+def get_sales_page(start_date=None, end_date=None, after=None, page_size=50, phone_model=None, payment_method=None):
+    """Return one page of sales, newest first, and the cursor of the next page.
+
+    Pages seek on ``(sale_date, id)`` instead of using OFFSET, so every page
+    costs the same however deep it is. Pass the returned cursor back as
+    ``after`` to get the following page; it is None on the last page.
+    Archived sales are merged in once the pages reach the archive watermark.
+    """
+    session = Session()
+    try:
+        dtypes = dict(SALES_DTYPES, id='int64')
+        query = select(*_projected_columns(session, Sale, dtypes)).where(
+            *_sales_filters(start_date, end_date, phone_model, payment_method)
+        )
+        if after is not None:
+            after_date, after_id = after
+            query = query.where(or_(
+                Sale.sale_date < after_date,
+                and_(Sale.sale_date == after_date, Sale.id < after_id)
+            ))
+        query = query.order_by(Sale.sale_date.desc(), Sale.id.desc()).limit(page_size + 1)
+
+        df = _frame_from_batches([session.connection().execute(query).all()], dtypes)
+    finally:
+        session.close()
+
+    watermark = archive.archive_watermark()
+    # Archived sales all predate the watermark, so a full page at or after it needs none of them
+    if watermark is not None and (len(df) <= page_size or df['sale_date'].iloc[-1] < watermark):
+        archived = archive.read_sales_page(list(dtypes), after, page_size + 1, start_date, end_date,
+                                           phone_model, payment_method)
+        if archived is not None:
+            parts = [archived[list(dtypes)]] if df.empty else [df, archived[list(dtypes)]]
+            df = (
+                pd.concat(parts, ignore_index=True)
+                .sort_values(['sale_date', 'id'], ascending=False, ignore_index=True)
+                .head(page_size + 1)
+            )
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        next_cursor = (df['sale_date'].iloc[-1].to_pydatetime(), int(df['id'].iloc[-1]))
+    return df.drop(columns='id'), next_cursor
+
+def count_sales(start_date=None, end_date=None, phone_model=None, payment_method=None):
+    session = Session()
+    try:
+        hot = session.execute(
+            select(func.count(Sale.id)).where(
+                *_sales_filters(start_date, end_date, phone_model, payment_method)
+            )
+        ).scalar()
+    finally:
+        session.close()
+    return hot + archive.count_sales(start_date, end_date, phone_model, payment_method)
+
 def get_sales_summary():
+    """Totals and per-model sales, read from the daily rollup rather than raw sales."""
     session = Session()
     try:
-        total_sales = session.query(func.sum(Sale.total_amount)).scalar() or 0
-        total_units = session.query(func.sum(Sale.quantity_sold)).scalar() or 0
+        total_sales, total_units = session.query(
+            func.sum(DailySalesRollup.revenue),
+            func.sum(DailySalesRollup.units_sold)
+        ).one()
         sales_by_model = session.query(
-            Sale.phone_model,
-            func.sum(Sale.quantity_sold).label('units_sold'),
-            func.sum(Sale.total_amount).label('total_revenue')
-        ).group_by(Sale.phone_model).all()
+            DailySalesRollup.phone_model,
+            func.sum(DailySalesRollup.units_sold).label('units_sold'),
+            func.sum(DailySalesRollup.revenue).label('total_revenue')
+        ).group_by(DailySalesRollup.phone_model).all()
 
         return {
-            'total_sales': total_sales,
-            'total_units': total_units,
+            'total_sales': total_sales or 0,
+            'total_units': total_units or 0,
             'sales_by_model': sales_by_model
         }
     finally:
-        session.close()
\ No newline at end of file
+        session.close()